@@ -26,154 +26,418 @@ def writearray(matrix):
         #print(ir,new_list[ir][:])
         print(new_list[ir][:])
     return()
+
+def writeout(infile,head,format="text"):
+    import gwmodel
+    outfile = infile.strip(".txt") + gwmodel.HEADFORMATS[format]
+    gwmodel.writehead(head,outfile,format)
+    return()
+import argparse
+import os
+import sys
+parser = argparse.ArgumentParser(description="2D steady confined aquifer model; input file name is read from stdin")
+parser.add_argument("--solver",default="loop",choices=["loop","jacobi","gauss-seidel","sor","direct","cg","multigrid",
+                                                  "domain"],
+                    help="loop = original list-of-lists sweep; the others use the NumPy array engine (gwmodel.py)")
+parser.add_argument("--omega",type=float,default=None,
+                    help="SOR relaxation factor (default: estimated from the grid)")
+parser.add_argument("--precision",default="double",choices=["double","mixed"],
+                    help="mixed: --solver cg or sor iterates in float32 inside float64 iterative refinement, "
+                         "stopping on --rtol (gwmodel.mixedsolve)")
+parser.add_argument("--inner",type=float,default=1.0e-4,
+                    help="relative residual of each float32 correction solve for --precision mixed")
+parser.add_argument("--reference",default=None,metavar="HEADFILE",
+                    help="report the largest difference of the computed heads from this head file (e.g. a "
+                         "float64 .out)")
+parser.add_argument("--tiled",type=int,default=None,metavar="DEPTH",
+                    help="gauss-seidel and sor: cache-blocked passes of DEPTH sweeps each (gwmodel.tiledsweep); "
+                         "the stopping tests are checked once per pass")
+parser.add_argument("--tilerows",type=int,default=None,
+                    help="rows per tile for --tiled (default: sized for a 2 MiB cache)")
+parser.add_argument("--precond",default=None,choices=["ic","jacobi","multigrid","none"],
+                    help="preconditioner for --solver cg (default ic)")
+parser.add_argument("--criterion",default="residual",choices=["residual","change"],
+                    help="cg stopping test: relative residual, or the sse of head changes used by the other solvers")
+parser.add_argument("--rtol",type=float,default=1.0e-10,
+                    help="relative residual tolerance for --criterion residual and --solver multigrid")
+parser.add_argument("--cycle",default=None,choices=["V","FMG"],
+                    help="multigrid cycle for --solver multigrid (default V)")
+parser.add_argument("--stop",nargs="+",default=None,metavar="NAME=TOL",
+                    help="stopping tests for --solver jacobi, gauss-seidel and sor, any one of which ends the "
+                         "iteration: sse (the input file's test), maxchange, residual, massbalance; "
+                         "e.g. --stop maxchange=1e-8 residual=1e-10 (default: sse=<input tolerance>)")
+parser.add_argument("--output",default="text",choices=["text","f64","f32","npy","gwz"],
+                    help="head file format: text .out (default), raw float64/float32 binary (.f64/.f32, row-major), "
+                         ".npy, or chunked zlib-compressed .gwz; gwmodel.readhead reads them all")
+parser.add_argument("--warmstart",default=None,metavar="HEADFILE",
+                    help="start iterating from a previous head field (.out, .npy, .gwz, .f64 or .f32) instead of "
+                         "the input heads; fixed-head boundary cells still come from the input file")
+parser.add_argument("--savings",action="store_true",
+                    help="with --warmstart, also run the cold start and report the iterations saved (array solvers)")
+parser.add_argument("--transient",type=int,default=None,metavar="NSTEPS",
+                    help="run NSTEPS implicit time steps from the input heads instead of the steady solve "
+                         "(see gwtransient.py); heads stream to <name>-transient.out (.npy, .f64 or .f32 with --output)")
+parser.add_argument("--dt",type=float,default=1.0,help="time step in days for --transient")
+parser.add_argument("--storage",type=float,default=1.0e-4,help="storativity for --transient")
+parser.add_argument("--scheme",default="BE",choices=["BE","CN"],
+                    help="--transient scheme: backward Euler or Crank-Nicolson")
+parser.add_argument("--every",type=int,default=1,help="with --transient, write every n-th step")
+parser.add_argument("--unconfined",type=float,default=None,metavar="BOTTOM",
+                    help="treat the aquifer as unconfined with its base at elevation BOTTOM (see gwunconfined.py); "
+                         "transmissivity becomes K*(head - BOTTOM) instead of K*deltaz")
+parser.add_argument("--method",default=None,choices=["picard","newton"],
+                    help="nonlinear iteration for --unconfined (default newton); newton solves its Jacobian with a "
+                         "sparse LU, so it takes --solver direct, and --solver cg needs --method picard")
+parser.add_argument("--workers",type=int,default=None,
+                    help="worker processes (strips) for --solver domain (default 4)")
+parser.add_argument("--overlap",type=int,default=None,
+                    help="rows each strip is widened by in its local solve for --solver domain (0 = block Jacobi, "
+                         "default 2)")
+parser.add_argument("--coarse",type=int,default=None,
+                    help="unknowns of the coarse problem of the two-level preconditioner for --solver domain "
+                         "(default 64 per worker, 0 = one-level Schwarz)")
+parser.add_argument("--cache",nargs="?",const="",default=None,metavar="DIR",
+                    help="reuse the head field of an identical earlier run (same input contents and options) from "
+                         "the result cache in DIR (default $GWCACHE or ~/.cache/gwmodel, see gwcache.py)")
+parser.add_argument("--cachesize",type=float,default=1024.0,help="cache size limit in MB for --cache")
+parser.add_argument("--batch",nargs="+",default=None,metavar="FILE",
+                    help="also solve these input files, which may differ from the stdin file only in pumping and "
+                         "starting heads; the operator is factored once (or preconditioned once with --solver cg) "
+                         "and every file gets its own .out")
+args = parser.parse_args()
+criteria = None
+if args.stop:
+    criteria = {}
+    for test in args.stop:
+        name, equals, value = test.partition("=")
+        if name not in ["sse","maxchange","residual","massbalance"] or not equals:
+            parser.error("--stop expects NAME=TOL with NAME one of sse, maxchange, residual, massbalance")
+        criteria[name] = float(value)
+if args.unconfined is not None and args.solver not in ["direct","cg"]:
+    parser.error("--unconfined needs --solver direct or cg (the linear solver of each nonlinear iteration)")
+if args.unconfined is not None and (args.transient is not None or args.batch):
+    parser.error("--unconfined is a steady solve and cannot be combined with --transient or --batch")
+if args.method is not None and args.unconfined is None:
+    parser.error("--method applies to --unconfined only")
+method = args.method or "newton"
+if args.unconfined is not None and method == "newton" and args.solver == "cg":
+    parser.error("--unconfined --method newton solves its Jacobian directly; use --solver direct or --method picard")
+if args.precond is not None and args.solver != "cg":
+    parser.error("--precond applies to --solver cg only")
+if args.transient is not None and args.solver not in ["direct","cg"]:
+    parser.error("--transient needs --solver direct or cg (the linear solver of each time step)")
+if args.batch and args.solver not in ["direct","cg"]:
+    parser.error("--batch needs --solver direct or cg (factored or preconditioned once for every file)")
+if args.solver == "loop":
+    # the list-of-lists solver has no mixed precision and no reference comparison
+    for option,given in [("--precision mixed",args.precision == "mixed"),("--reference",args.reference)]:
+        if given:
+            parser.error(option + " needs one of the array solvers (--solver jacobi, sor, cg, ...)")
+if args.stop and args.solver not in ["jacobi","gauss-seidel","sor"]:
+    # the loop solver only knows the input file's sse test; cg, direct, ... have their own
+    parser.error("--stop applies to --solver jacobi, gauss-seidel and sor only")
+# options that only some solvers read; with any other they would be silently ignored
+for option,value,solvers in [("--omega",args.omega,["sor"]),("--tiled",args.tiled,["gauss-seidel","sor"]),
+                             ("--tilerows",args.tilerows,["gauss-seidel","sor"]),("--cycle",args.cycle,["multigrid"]),
+                             ("--workers",args.workers,["domain"]),("--overlap",args.overlap,["domain"]),
+                             ("--coarse",args.coarse,["domain"])]:
+    if value is not None and args.solver not in solvers:
+        parser.error(option + " applies to --solver " + " and ".join(solvers) + " only")
+if args.tilerows is not None and args.tiled is None:
+    parser.error("--tilerows needs --tiled")
+if args.tiled is not None and args.precision == "mixed":
+    parser.error("--tiled does not apply to --precision mixed")
+solver = args.solver
+omega = args.omega
+precond = {None:"ic","none":None}.get(args.precond,args.precond)
 verbose = False
 echoinput = False
 infile = input()
 print(infile)
-localfile = open(infile,"r") # connect and read file for 2D gw model
-deltax = float(localfile.readline())
-deltay = float(localfile.readline())
-deltaz = float(localfile.readline())
-nrows = int(localfile.readline())
-ncols = int(localfile.readline())
-tolerance = float(localfile.readline())
-maxiter = int(localfile.readline())
-distancex = [] # empty list
-distancex.append([float(n) for n in localfile.readline().strip().split()])
-distancey = [] # empty list
-distancey.append([float(n) for n in localfile.readline().strip().split()])
-boundarytop = [] #empty list
-boundarytop.append([float(n) for n in localfile.readline().strip().split()])
-boundarybottom = [] #empty list
-boundarybottom.append([int(n) for n in localfile.readline().strip().split()])
-boundaryleft = [] #empty list
-boundaryleft.append([int(n) for n in localfile.readline().strip().split()])
-boundaryright = [] #empty list
-boundaryright.append([int(n) for n in localfile.readline().strip().split()])
-head =[] # empty list
-for irow in range(nrows):
-        head.append([float(n) for n in localfile.readline().strip().split()])
-#writearray(head)
-hydcondx = [] # empty list
-for irow in range(nrows):
-        hydcondx.append([float(n) for n in localfile.readline().strip().split()])
-#writearray(hydcondx)
-hydcondy = [] # empty list
-for irow in range(nrows):
-        hydcondy.append([float(n) for n in localfile.readline().strip().split()])
-#writearray(hydcondy)
-pumping = [] # empty list
-for irow in range(nrows):
-        pumping.append([float(n) for n in localfile.readline().strip().split()])
-#writearray(pumping)
-localfile.close() # Disconnect the file
-##
-if echoinput:
-    print("--Echo Inputs--")
-    print("--head--")
-    writearray(head)
-    print("--Kx--")
-    writearray(hydcondx)
-    print("--Ky--")
-    writearray(hydcondy)
-    print("pumping-recharge")
-    writearray(pumping)
-    print()
-##
-amat = [[0 for j in range(ncols)] for i in range(nrows)]
-bmat = [[0 for j in range(ncols)] for i in range(nrows)]
-cmat = [[0 for j in range(ncols)] for i in range(nrows)]
-dmat = [[0 for j in range(ncols)] for i in range(nrows)]
-qrat = [[0 for j in range(ncols)] for i in range(nrows)]
-## Transmissivity Arrays
-for irow in range(1,nrows-1):
-    for jcol in range(1,ncols-1):
-        amat[irow][jcol] = (( hydcondx[irow-1][jcol  ]+ hydcondx[irow  ][jcol  ]) * deltaz ) /(2.0*deltax**2)
-        bmat[irow][jcol] = (( hydcondx[irow  ][jcol  ]+ hydcondx[irow+1][jcol  ]) * deltaz ) /(2.0*deltax**2)
-        cmat[irow][jcol] = (( hydcondy[irow  ][jcol-1]+ hydcondy[irow  ][jcol  ]) * deltaz ) /(2.0*deltay**2)
-        dmat[irow][jcol] = (( hydcondy[irow  ][jcol  ]+ hydcondy[irow  ][jcol+1]) * deltaz ) /(2.0*deltay**2)
-## Net Pumping Array
-for irow in range(nrows):
-    for jcol in range(ncols):
-        qrat[irow][jcol] = (pumping[irow][jcol])/(deltax*deltay)/365.0
-## Headold array
-headold = [[0 for jc in range(ncols)] for ir in range(nrows)] #force a new matrix
-headold = update(head,headold) # update
-if echoinput:
-    print("--before iterations--\n head")
-    writearray(head)
-    print("--headold--")
-    writearray(headold)
-    print("--qrat--")
-    writearray(qrat)
-    print("--amat--")
-    writearray(amat)
-    print("--bmat--")
-    writearray(bmat)
-    print("--cmat--")
-    writearray(cmat)
-    print("--dmat--")
-    writearray(dmat)
-    print("----")
-    print()
-tolflag = False
-
-for iter in range(maxiter):
-    if verbose:
-        print("begin iteration\n head")
+if solver == "loop" and os.path.isdir(infile):
+    sys.exit(infile + ": binary model directories need one of the array solvers (--solver jacobi, direct, ...)")
+cachekey = None
+if args.cache is not None and args.transient is None and not args.batch:
+    # steady one-layer runs: key on the input contents and every option that can change the heads
+    import gwcache
+    import gwmodel
+    cachedir = args.cache or None
+    cachebytes = int(args.cachesize*2**20)
+    settings = {name:value for name,value in vars(args).items()
+                if name not in ["output","reference","savings","cache","cachesize"]}
+    if args.warmstart:
+        settings["warmstart"] = gwcache.filedigest(args.warmstart)
+    cachemodel = gwmodel.readmodel(infile)
+    if "nlayers" not in cachemodel:
+        cachekey = gwcache.modelkey(cachemodel,"script",settings)
+        hit = gwcache.lookup(cachekey,cachedir)
+        if hit is not None:
+            print("Cached result",cachekey[:16],file=sys.stderr)
+            writeout(infile,hit[0]["head"],args.output)
+            sys.exit()
+if args.transient is not None:
+    import gwmodel
+    import gwtransient
+    if args.output == "gwz":
+        sys.exit("--transient writes npy, f64, f32 or text output")
+    model = gwmodel.readmodel(infile)
+    if args.warmstart:
+        model = gwmodel.warmstart(model,args.warmstart)
+    outfile = infile.strip(".txt") + "-transient" + gwmodel.HEADFORMATS[args.output]
+    head, info = gwtransient.runtransient(model,args.storage,args.dt,args.transient,outfile,args.output,args.every,
+                                          args.scheme,solver=solver,
+                                          precond=precond,tolerance=args.rtol,verbose=verbose)
+    print("Setup time (s) =",round(info["setup"],6),"Solve time (s) =",round(info["solve"],6),
+          "Steps =",info["steps"],"Saved =",len(info["times"]),file=sys.stderr)
+    sys.exit()
+if args.batch:
+    import gwmodel
+    model = gwmodel.readmodel(infile)
+    cases = [infile] + args.batch
+    pumpings = []
+    for case in cases:
+        other = gwmodel.readmodel(case)
+        if not gwmodel.sameaquifer(model,other):
+            sys.exit(case + ": aquifer differs from " + infile + " in more than pumping")
+        pumpings.append(other["pumping"])
+    heads, info = gwmodel.batchsolve(model,pumpings,solver=solver,
+                                     precond=precond,tolerance=args.rtol,verbose=verbose)
+    print("Setup time (s) =",round(info["setup"],6),"Solve time (s) =",round(info["solve"],6),
+          "Cases =",len(cases),file=sys.stderr)
+    for case,head in zip(cases,heads):
+        writeout(case,head,args.output)
+    sys.exit()
+if solver != "loop":
+    import gwmodel
+    model = gwmodel.readmodel(infile)
+    if args.unconfined is not None:
+        import gwunconfined
+        head, info = gwunconfined.solve(model,args.unconfined,method=method,
+                                        solver="cg" if solver == "cg" else "direct",precond=precond,verbose=verbose)
+        print("Nonlinear iterations =",info["iterations"],"Linear iterations =",info["linear"],
+              "Residual =",info["residual"],file=sys.stderr)
+        if not info["converged"]:
+            print("Warning: --unconfined",method,"did not converge in",info["iterations"],
+                  "iterations (last max head change",info["history"][-1],"m); heads written anyway",file=sys.stderr)
+        if cachekey and info["converged"]:
+            gwcache.store(cachekey,{"head":head},info,cachedir,cachebytes)
+        writeout(infile,head,args.output)
+        sys.exit()
+    if "nlayers" in model:
+        # layered binary model (gwlayers.py): one head file per layer, top layer first
+        import gwlayers
+        if solver not in ["direct","cg"]:
+            parser.error("layered models need --solver direct or cg")
+        heads, info = gwlayers.solve(model,solver=solver,precond=precond,
+                                     tolerance=args.rtol,verbose=verbose)
+        print("Setup time (s) =",round(info["setup"],6),"Solve time (s) =",round(info["solve"],6),
+              "Layers =",model["nlayers"],file=sys.stderr)
+        for k in range(model["nlayers"]):
+            writeout(infile.strip(".txt") + "-layer" + str(k + 1),heads[k],args.output)
+        sys.exit()
+    if args.precision == "mixed":
+        if solver not in ["cg","sor"]:
+            sys.exit("--precision mixed needs --solver cg or sor")
+        options = {"precision":"mixed","precond":precond,"tolerance":args.rtol,"inner":args.inner,"omega":omega}
+    elif solver == "domain":
+        # strip domain decomposition over worker processes (gwdomain.py)
+        import gwdomain
+        if args.warmstart:
+            model = gwmodel.warmstart(model,args.warmstart)
+        head, info = gwdomain.ddsolve(model,nworkers=4 if args.workers is None else args.workers,
+                                      overlap=2 if args.overlap is None else args.overlap,coarse=args.coarse,
+                                      tolerance=args.rtol,verbose=verbose)
+        print("Setup time (s) =",round(info["setup"],6),"Solve time (s) =",round(info["iterate"],6),
+              "Workers =",info["workers"],"Coarse unknowns =",info["coarse"],"Outer iterations =",info["iterations"],
+              file=sys.stderr)
+    elif solver == "cg":
+        rtol = args.rtol if args.criterion == "residual" else None
+        options = {"precond":precond,"criterion":args.criterion,"tolerance":rtol}
+    elif solver == "multigrid":
+        options = {"cycle":args.cycle or "V","tolerance":args.rtol}
+    else:
+        options = {"omega":omega,"criteria":criteria,"depth":args.tiled,"tilerows":args.tilerows}
+    if solver != "domain":
+        head, info = gwmodel.solve(model,solver=solver,start=args.warmstart,verbose=verbose,**options)
+    if args.warmstart and solver != "domain":
+        print("Warm start iterations =",info["iterations"],file=sys.stderr)
+        if args.savings:
+            cold = gwmodel.solve(model,solver=solver,verbose=verbose,**options)[1]
+            print("Cold start iterations =",cold["iterations"],"Saved =",cold["iterations"] - info["iterations"],
+                  "(" + str(round(100.0*(cold["iterations"] - info["iterations"])/cold["iterations"],1)) + "%)",
+                  file=sys.stderr)
+    if args.precision == "mixed":
+        print("Refinement steps =",info["iterations"],"Float32 iterations =",sum(info["inner"]),
+              "Relative residual =",info["residual"],"Last correction (m) =",
+              info["corrections"][-1] if info["corrections"] else 0.0,file=sys.stderr)
+    elif solver == "multigrid":
+        print("Cycles =",info["iterations"],"Relative residual =",info["residual"],"Converged =",info["converged"],
+              "Stagnated =",info["stagnated"],file=sys.stderr)
+    elif solver == "cg":
+        print("Iterations =",info["iterations"],"Relative residual =",info["residual"],"Converged =",info["converged"],
+              file=sys.stderr)
+    elif "stopped" in info:
+        print("Iterations =",info["iterations"],"Stopped by",info["stopped"],file=sys.stderr)
+    iter = info["iterations"] - 1
+    percentdiff = info["closure"]
+    tolflag = info["converged"]
+    if not tolflag:
+        print("Warning: --solver",solver,"did not converge in",info["iterations"],
+              "iterations (closure " + str(percentdiff) + "); heads written anyway",file=sys.stderr)
+    if solver == "direct":
+        # stdout is the .out file under run_cases.sc, so timings go to stderr
+        print("Assembly time (s) =",round(info["assembly"],6),"Solve time (s) =",round(info["solve"],6),file=sys.stderr)
+    if args.reference:
+        print("Max difference from",args.reference,"(m) =",abs(head - gwmodel.readhead(args.reference)).max(),
+              file=sys.stderr)
+else:
+    localfile = open(infile,"r") # connect and read file for 2D gw model
+    deltax = float(localfile.readline())
+    deltay = float(localfile.readline())
+    deltaz = float(localfile.readline())
+    nrows = int(localfile.readline())
+    ncols = int(localfile.readline())
+    tolerance = float(localfile.readline())
+    maxiter = int(localfile.readline())
+    distancex = [] # empty list
+    distancex.append([float(n) for n in localfile.readline().strip().split()])
+    distancey = [] # empty list
+    distancey.append([float(n) for n in localfile.readline().strip().split()])
+    boundarytop = [] #empty list
+    boundarytop.append([float(n) for n in localfile.readline().strip().split()])
+    boundarybottom = [] #empty list
+    boundarybottom.append([int(n) for n in localfile.readline().strip().split()])
+    boundaryleft = [] #empty list
+    boundaryleft.append([int(n) for n in localfile.readline().strip().split()])
+    boundaryright = [] #empty list
+    boundaryright.append([int(n) for n in localfile.readline().strip().split()])
+    head =[] # empty list
+    for irow in range(nrows):
+            head.append([float(n) for n in localfile.readline().strip().split()])
+    #writearray(head)
+    hydcondx = [] # empty list
+    for irow in range(nrows):
+            hydcondx.append([float(n) for n in localfile.readline().strip().split()])
+    #writearray(hydcondx)
+    hydcondy = [] # empty list
+    for irow in range(nrows):
+            hydcondy.append([float(n) for n in localfile.readline().strip().split()])
+    #writearray(hydcondy)
+    pumping = [] # empty list
+    for irow in range(nrows):
+            pumping.append([float(n) for n in localfile.readline().strip().split()])
+    #writearray(pumping)
+    localfile.close() # Disconnect the file
+    if args.warmstart:
+        import gwmodel
+        head = gwmodel.warmstart(gwmodel.readmodel(infile),args.warmstart)["head"].tolist()
+    ##
+    if echoinput:
+        print("--Echo Inputs--")
+        print("--head--")
+        writearray(head)
+        print("--Kx--")
+        writearray(hydcondx)
+        print("--Ky--")
+        writearray(hydcondy)
+        print("pumping-recharge")
+        writearray(pumping)
+        print()
+    ##
+    amat = [[0 for j in range(ncols)] for i in range(nrows)]
+    bmat = [[0 for j in range(ncols)] for i in range(nrows)]
+    cmat = [[0 for j in range(ncols)] for i in range(nrows)]
+    dmat = [[0 for j in range(ncols)] for i in range(nrows)]
+    qrat = [[0 for j in range(ncols)] for i in range(nrows)]
+    ## Transmissivity Arrays
+    for irow in range(1,nrows-1):
+        for jcol in range(1,ncols-1):
+            amat[irow][jcol] = (( hydcondx[irow-1][jcol  ]+ hydcondx[irow  ][jcol  ]) * deltaz ) /(2.0*deltax**2)
+            bmat[irow][jcol] = (( hydcondx[irow  ][jcol  ]+ hydcondx[irow+1][jcol  ]) * deltaz ) /(2.0*deltax**2)
+            cmat[irow][jcol] = (( hydcondy[irow  ][jcol-1]+ hydcondy[irow  ][jcol  ]) * deltaz ) /(2.0*deltay**2)
+            dmat[irow][jcol] = (( hydcondy[irow  ][jcol  ]+ hydcondy[irow  ][jcol+1]) * deltaz ) /(2.0*deltay**2)
+    ## Net Pumping Array
+    for irow in range(nrows):
+        for jcol in range(ncols):
+            qrat[irow][jcol] = (pumping[irow][jcol])/(deltax*deltay)/365.0
+    ## Headold array
+    headold = [[0 for jc in range(ncols)] for ir in range(nrows)] #force a new matrix
+    headold = update(head,headold) # update
+    if echoinput:
+        print("--before iterations--\n head")
         writearray(head)
         print("--headold--")
         writearray(headold)
         print("--qrat--")
         writearray(qrat)
+        print("--amat--")
+        writearray(amat)
+        print("--bmat--")
+        writearray(bmat)
+        print("--cmat--")
+        writearray(cmat)
+        print("--dmat--")
+        writearray(dmat)
         print("----")
+        print()
+    tolflag = False
 
-# Boundary Conditions
+    for iter in range(maxiter):
+        if verbose:
+            print("begin iteration\n head")
+            writearray(head)
+            print("--headold--")
+            writearray(headold)
+            print("--qrat--")
+            writearray(qrat)
+            print("----")
 
-# first and last row special == no flow boundaries
-    for jcol in range(ncols):
-        if boundarytop[0][jcol] == 0: # no - flow at top
-            head [0][jcol ] = head[1][jcol ]
-        if boundarybottom[0][ jcol ] == 0: # no - flow at bottom
-            head [nrows-1][jcol ] = head[nrows-2][jcol ]
-# first and last column special == no flow boundaries     
-    for irow in range(nrows): 
-        if  boundaryleft[0][ irow ] == 0:
-            head[irow][0] = head [irow][1] # no - flow at left
-        if boundaryright[0][ irow ] == 0: 
-            head [irow][ncols-1] = head[ irow ][ncols-2] # no - flow at right
-# interior updates
-    for irow in range(1,nrows-1):
-        for jcol in range(1,ncols-1):
-            head[irow][jcol]=( -qrat[irow][jcol] \
-+amat[irow][jcol]*head[irow-1][jcol  ] \
-+bmat[irow][jcol]*head[irow+1][jcol  ] \
-+cmat[irow][jcol]*head[irow  ][jcol-1] \
-+dmat[irow][jcol]*head[irow  ][jcol+1] )\
-            /(amat[ irow][jcol ]+ bmat[ irow][jcol ]+ cmat[ irow][jcol ]+ dmat[ irow][jcol ])
+    # Boundary Conditions
 
-    if verbose:
-        print("end iteration\n head")
-        writearray(head)
-        print("--headold--")
-        writearray(headold)
-        print("--qrat--")
-        writearray(qrat)
-        print("----")           
-# test for stopping iterations
-##    print("end iteration")
-##    writearray(head)
-##    print("----")
-##    writearray(headold)
-    percentdiff = sse(head,headold)
+    # first and last row special == no flow boundaries
+        for jcol in range(ncols):
+            if boundarytop[0][jcol] == 0: # no - flow at top
+                head [0][jcol ] = head[1][jcol ]
+            if boundarybottom[0][ jcol ] == 0: # no - flow at bottom
+                head [nrows-1][jcol ] = head[nrows-2][jcol ]
+    # first and last column special == no flow boundaries     
+        for irow in range(nrows): 
+            if  boundaryleft[0][ irow ] == 0:
+                head[irow][0] = head [irow][1] # no - flow at left
+            if boundaryright[0][ irow ] == 0: 
+                head [irow][ncols-1] = head[ irow ][ncols-2] # no - flow at right
+    # interior updates
+        for irow in range(1,nrows-1):
+            for jcol in range(1,ncols-1):
+                head[irow][jcol]=( -qrat[irow][jcol] \
+    +amat[irow][jcol]*head[irow-1][jcol  ] \
+    +bmat[irow][jcol]*head[irow+1][jcol  ] \
+    +cmat[irow][jcol]*head[irow  ][jcol-1] \
+    +dmat[irow][jcol]*head[irow  ][jcol+1] )\
+                /(amat[ irow][jcol ]+ bmat[ irow][jcol ]+ cmat[ irow][jcol ]+ dmat[ irow][jcol ])
+
+        if verbose:
+            print("end iteration\n head")
+            writearray(head)
+            print("--headold--")
+            writearray(headold)
+            print("--qrat--")
+            writearray(qrat)
+            print("----")           
+    # test for stopping iterations
+    ##    print("end iteration")
+    ##    writearray(head)
+    ##    print("----")
+    ##    writearray(headold)
+        percentdiff = sse(head,headold)
 
-    if  percentdiff <= tolerance:
-#        print("Exit iterations in velocity potential because tolerance met ")
-#        print("Iterations =" , iter+1 ) ;
-        tolflag = True
-        break
-    # update    
-    headold = update(head,headold)
+        if  percentdiff <= tolerance:
+    #        print("Exit iterations in velocity potential because tolerance met ")
+    #        print("Iterations =" , iter+1 ) ;
+            tolflag = True
+            break
+        # update    
+        headold = update(head,headold)
 # next iteration
 
 #print("End Calculations")
@@ -188,9 +452,7 @@ b = numpy.array(head)
 #print("----")
 #writearray(head)
 #print("----")
-outfile = infile.strip(".txt") + '.out'
-localfile = open(outfile,"w") # connect and read file for 2D gw model
-localfile.writelines(outfile+'\n')
-for row in range(len(head)):
-    localfile.write(" ".join(map(str,head[row]))+"\n")
-localfile.close()
+# a head field that missed its tolerance is not cached: later hits would return it as if solved
+if cachekey and tolflag:
+    gwcache.store(cachekey,{"head":numpy.array(head)},{},cachedir,cachebytes)
+writeout(infile,head,args.output)
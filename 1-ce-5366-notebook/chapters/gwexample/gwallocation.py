@@ -0,0 +1,60 @@
+# Pumping allocation LP for the groundwater simulation-optimization example
+# Companion to gwmodel.py.  The decision variables are the pumping rates
+# at the candidate wells (Mm^3/yr, the unit rate of the influence table),
+# and the constraints are assembled a block at a time instead of row by row:
+#   drawdown   ddn[cells, wells] q <= limits   one row per cell with a finite
+#                                              limit, taken straight from the
+#                                              (dense or scipy.sparse) table
+#   demand     sum(q) == demand                one row of ones
+#   fixed      wells forced to zero pumping are removed as columns, not
+#              written as equality rows
+# so the LP sent to linprog has only the binding structure, and the build
+# time is linear in the number of stored influence coefficients.
+import numpy
+
+def allocationproblem(ddn,cost,demand,limits,fixed=None,upper=None):
+    """Assemble the allocation LP; returns a dict with the linprog arguments and the column map.
+
+    ddn is the influence table (ncells, nwells), cost the cost per unit
+    pumping at each well, demand the total pumping, and limits the
+    largest allowed drawdown at each cell (a scalar or one value per
+    cell; inf or nan where there is none).  fixed lists wells (column
+    numbers) that may not pump, upper an optional largest rate per well.
+    The dict holds c, A_ub, b_ub, A_eq, b_eq and bounds for the kept
+    wells, "columns" their well numbers and "nwells" the table width;
+    see allocation() for mapping a solution back to all wells."""
+    import scipy.sparse
+    ddn = scipy.sparse.csr_matrix(ddn)
+    ncells,nwells = ddn.shape
+    limits = numpy.broadcast_to(numpy.asarray(limits,dtype=numpy.float64),(ncells,))
+    keep = numpy.ones(nwells,dtype=bool)
+    if fixed is not None:
+        keep[numpy.asarray(fixed,dtype=numpy.int64)] = False
+    columns = numpy.nonzero(keep)[0]
+    rows = numpy.nonzero(numpy.isfinite(limits))[0]
+    if upper is None:
+        upper = numpy.full(nwells,numpy.inf)
+    upper = numpy.broadcast_to(numpy.asarray(upper,dtype=numpy.float64),(nwells,))
+    problem = {"c":numpy.asarray(cost,dtype=numpy.float64)[columns],
+               "A_ub":ddn[rows][:,columns] if rows.size > 0 else None,
+               "b_ub":limits[rows] if rows.size > 0 else None,
+               "A_eq":scipy.sparse.csr_matrix(numpy.ones((1,columns.size))),
+               "b_eq":numpy.array([demand],dtype=numpy.float64),
+               "bounds":numpy.column_stack((numpy.zeros(columns.size),upper[columns])),
+               "columns":columns,"nwells":nwells}
+    return(problem)
+
+def allocation(x,problem):
+    """Pumping at every well from a solution x over the kept columns (zero at the fixed wells)."""
+    pumping = numpy.zeros(problem["nwells"])
+    pumping[problem["columns"]] = x
+    return(pumping)
+
+def solveallocation(problem,method="highs",options=None):
+    """Solve the allocation LP with scipy.optimize.linprog; returns (pumping at every well, linprog result)."""
+    from scipy.optimize import linprog
+    arguments = {name:problem[name] for name in ["c","A_ub","b_ub","A_eq","b_eq","bounds"]}
+    opt = linprog(method=method,options=options,**arguments)
+    if opt.x is None:
+        return(None,opt)
+    return(allocation(opt.x,problem),opt)
@@ -0,0 +1,168 @@
+# Sweep benchmarks for the 2D groundwater model
+# Companion to gwmodel.py.  Times the red-black Gauss-Seidel/SOR sweep of
+# gwmodel.solve, plain (redblacksweep, one pass over the arrays per sweep)
+# and cache-blocked (tiledsweep, depth sweeps per pass), and reports
+#   cells/s     cell updates per second
+#   stencil GB/s  the array traffic an unblocked sweep would need for that
+#               rate: head, amat..qrat and invdiag read, head written,
+#               64 bytes per cell update
+#   copy GB/s   numpy copy of a large array (read plus write), for scale
+# The plain sweep also streams NumPy's full-size temporaries (about ten
+# per color), so on grids larger than the cache it runs well below the
+# copy bandwidth; in the blocked sweep those temporaries are tile-sized
+# and stay in cache.  Grids that fit in cache gain nothing from blocking.
+# With --multigrid it instead solves lognormal conductivity fields of
+# strength --sigma with gwmultigrid.mgsolve, plain and CG-accelerated,
+# and reports the cycles and the largest head difference from a direct
+# solve (the check that a heterogeneous field is solved, not only stopped).
+# With --domain it times gwdomain.ddsolve over --workers counts (strong
+# scaling: one grid, more workers), one-level and two-level Schwarz, and
+# reports the outer iterations and the setup and iteration times.
+# Usage: python gwbench.py [--sizes N ...] [--depth D ...] [--input FILE]
+#        python gwbench.py --multigrid [--sizes N ...] [--sigma S ...]
+#        python gwbench.py --domain [--sizes N ...] [--workers W ...]
+import argparse
+import sys
+import time
+import numpy
+import gwmodel
+
+STENCILBYTES = 8*8
+
+def syntheticmodel(n,seed=0):
+    """n x n confined model with log-uniform conductivity, fixed heads on the left and no-flow elsewhere."""
+    rng = numpy.random.default_rng(seed)
+    model = {"deltax":100.0,"deltay":100.0,"deltaz":50.0,"nrows":n,"ncols":n,"tolerance":1.0e-6,"maxiter":10000}
+    model["distancex"] = numpy.arange(n)*100.0
+    model["distancey"] = numpy.arange(n)*100.0
+    model["boundarytop"] = numpy.zeros(n,dtype=numpy.int64)
+    model["boundarybottom"] = numpy.zeros(n,dtype=numpy.int64)
+    model["boundaryleft"] = numpy.ones(n,dtype=numpy.int64)
+    model["boundaryright"] = numpy.zeros(n,dtype=numpy.int64)
+    model["head"] = numpy.full((n,n),10.0)
+    model["hydcondx"] = 10.0**rng.uniform(0.0,2.0,(n,n))
+    model["hydcondy"] = model["hydcondx"].copy()
+    model["pumping"] = numpy.zeros((n,n))
+    model["pumping"][n//2,n//2] = 1.0e5
+    return(model)
+
+def lognormalmodel(n,sigma,seed=0):
+    """syntheticmodel with white-noise lognormal conductivity 10*exp(sigma*N(0,1)) and zero starting heads."""
+    model = syntheticmodel(n,seed)
+    rng = numpy.random.default_rng(seed + 1)
+    model["hydcondx"] = 10.0*numpy.exp(sigma*rng.standard_normal((n,n)))
+    model["hydcondy"] = model["hydcondx"].copy()
+    # fixed heads of 10 on the left edge, zero everywhere else to start
+    model["head"][:,1:] = 0.0
+    return(model)
+
+def benchmultigrid(model,tolerance=1.0e-10):
+    """Multigrid solves of model, plain and CG-accelerated, checked against a direct solve; returns a result dict."""
+    import gwmultigrid
+    exact = gwmodel.directsolve(model)[0]
+    result = {"nrows":model["nrows"],"ncols":model["ncols"]}
+    for name,accelerate in [("plain",False),("cg",True)]:
+        start = time.perf_counter()
+        head,info = gwmultigrid.mgsolve(model,tolerance=tolerance,maxiter=1000,accelerate=accelerate)
+        result[name] = {"cycles":info["iterations"],"converged":info["converged"],"stagnated":info["stagnated"],
+                        "seconds":time.perf_counter() - start,"error":float(numpy.abs(head - exact).max())}
+    return(result)
+
+def benchdomain(model,nworkers,overlap=2,coarse=None):
+    """One gwdomain.ddsolve of model; returns a result dict with its outer iterations and times."""
+    import gwdomain
+    start = time.perf_counter()
+    head,info = gwdomain.ddsolve(model,nworkers=nworkers,overlap=overlap,coarse=coarse)
+    return({"workers":info["workers"],"coarse":info["coarse"],"iterations":info["iterations"],
+            "setup":info["setup"],"iterate":info["iterate"],"wall":time.perf_counter() - start})
+
+def copybandwidth(nbytes=1 << 28,repeat=3):
+    """Best numpy copy rate over repeat copies of an nbytes array, in GB/s (bytes read plus written)."""
+    source = numpy.ones(nbytes//8)
+    target = numpy.empty_like(source)
+    best = float("inf")
+    for k in range(repeat):
+        start = time.perf_counter()
+        numpy.copyto(target,source)
+        best = min(best,time.perf_counter() - start)
+    return(2.0*nbytes/best/1.0e9)
+
+def benchsweeps(model,nsweeps=16,depth=None,tilerows=None,omega=1.5):
+    """Time nsweeps sweeps (plain if depth is None, else tiled passes of depth); returns a result dict."""
+    stencil = gwmodel.closeboundary(gwmodel.buildstencil(model),model)
+    head = numpy.array(model["head"],dtype=numpy.float64)
+    colors = gwmodel.colorslices(model["nrows"],model["ncols"])
+    cells = (model["nrows"] - 2)*(model["ncols"] - 2)
+    # one untimed pass to fault in the arrays
+    gwmodel.redblacksweep(head,stencil,colors,omega)
+    start = time.perf_counter()
+    done = 0
+    while done < nsweeps:
+        if depth is None:
+            gwmodel.redblacksweep(head,stencil,colors,omega)
+            done += 1
+        else:
+            gwmodel.tiledsweep(head,stencil,min(depth,nsweeps - done),tilerows,omega)
+            done += depth
+    seconds = time.perf_counter() - start
+    rate = cells*min(done,nsweeps)/seconds
+    if depth is not None and tilerows is None:
+        tilerows = gwmodel.tilerowsfor(model["ncols"],depth)
+    return({"nrows":model["nrows"],"ncols":model["ncols"],"depth":depth,"tilerows":tilerows,
+            "seconds":seconds,"cellrate":rate,"bandwidth":rate*STENCILBYTES/1.0e9})
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark plain and cache-blocked red-black sweeps")
+    parser.add_argument("--sizes",type=int,nargs="+",default=[500,1000,2000,4000],help="grid sizes n (n x n)")
+    parser.add_argument("--depth",type=int,nargs="+",default=[2,4,8],help="sweeps per tiled pass")
+    parser.add_argument("--tilerows",type=int,default=None,help="rows per tile (default gwmodel.tilerowsfor)")
+    parser.add_argument("--sweeps",type=int,default=16,help="timed sweeps per measurement")
+    parser.add_argument("--input",default=None,help="benchmark this model file instead of synthetic grids")
+    parser.add_argument("--multigrid",action="store_true",
+                        help="benchmark gwmultigrid.mgsolve on lognormal conductivity instead of the sweeps")
+    parser.add_argument("--sigma",type=float,nargs="+",default=[1.0,2.0],
+                        help="lognormal strengths for --multigrid (standard deviation of ln K)")
+    parser.add_argument("--domain",action="store_true",
+                        help="benchmark gwdomain.ddsolve strong scaling instead of the sweeps")
+    parser.add_argument("--workers",type=int,nargs="+",default=[1,2,4,8,16],help="worker counts for --domain")
+    args = parser.parse_args()
+    if args.domain:
+        print("%6s %6s %8s %8s %10s %10s %10s %10s %8s" % ("nrows","ncols","workers","coarse","outer its",
+                                                           "setup s","iterate s","wall s","speedup"))
+        for n in args.sizes:
+            model = syntheticmodel(n)
+            for coarse in [0,None]:
+                base = None
+                for nworkers in args.workers:
+                    result = benchdomain(model,nworkers,coarse=coarse)
+                    base = base or result["wall"]
+                    print("%6d %6d %8d %8d %10d %10.3f %10.3f %10.3f %8.2f" % (n,n,result["workers"],
+                          result["coarse"],result["iterations"],result["setup"],result["iterate"],result["wall"],
+                          base/result["wall"]))
+                    sys.stdout.flush()
+        sys.exit()
+    if args.multigrid:
+        print("%6s %6s %6s %12s %12s %12s %12s" % ("sigma","nrows","ncols","plain cycles","plain error",
+                                                  "cg cycles","cg error"))
+        for sigma in args.sigma:
+            for n in args.sizes:
+                result = benchmultigrid(lognormalmodel(n,sigma))
+                plain = result["plain"]
+                cg = result["cg"]
+                print("%6.2f %6d %6d %12s %12.3g %12s %12.3g" % (sigma,n,n,
+                      str(plain["cycles"]) + ("" if plain["converged"] else "*"),plain["error"],
+                      str(cg["cycles"]) + ("" if cg["converged"] else "*"),cg["error"]))
+                sys.stdout.flush()
+        print("* not converged")
+        sys.exit()
+    models = [gwmodel.readmodel(args.input)] if args.input else [syntheticmodel(n) for n in args.sizes]
+    print("copy bandwidth (GB/s) =",round(copybandwidth(),2))
+    print("%6s %6s %6s %9s %12s %12s %8s" % ("nrows","ncols","depth","tilerows","cells/s","stencil GB/s","speedup"))
+    for model in models:
+        plain = benchsweeps(model,args.sweeps)
+        results = [plain] + [benchsweeps(model,args.sweeps,depth,args.tilerows) for depth in args.depth]
+        for result in results:
+            print("%6d %6d %6s %9s %12.4g %12.2f %8.2f" % (result["nrows"],result["ncols"],result["depth"] or "-",
+                  result["tilerows"] or "-",result["cellrate"],result["bandwidth"],
+                  result["cellrate"]/plain["cellrate"]))
+        sys.stdout.flush()
@@ -0,0 +1,150 @@
+# Content-addressed result cache for the 2D groundwater model
+# Companion to gwmodel.py.  A result (head field, influence matrix) is
+# stored under the SHA-256 of everything that determines it: the model
+# scalars (grid, tolerance, maxiter), every model array (conductivities,
+# boundary flags, starting heads, pumping, ...) byte for byte, and the
+# solver settings.  Any change to the inputs gives a new key, so entries
+# never go stale and are never invalidated; unused ones age out.
+# Each entry is one <key>.npz file in the cache directory holding the
+# result arrays and the solver info as JSON.  A hit touches the file's
+# modification time, and when the directory grows past maxbytes the
+# least recently used entries are deleted.
+# Default directory: $GWCACHE, else ~/.cache/gwmodel; default size 1 GiB.
+import hashlib
+import json
+import os
+import zipfile
+import numpy
+import gwmodel
+
+CACHEVERSION = 1
+MAXBYTES = 1 << 30
+
+def cachedirectory(cachedir=None):
+    """The cache directory: cachedir, $GWCACHE or ~/.cache/gwmodel."""
+    if cachedir is None:
+        cachedir = os.environ.get("GWCACHE",os.path.join(os.path.expanduser("~"),".cache","gwmodel"))
+    return(cachedir)
+
+def jsonvalue(value):
+    """JSON stand-in for settings and info values json cannot write (arrays by content digest)."""
+    if isinstance(value,numpy.ndarray):
+        return("sha256:" + hashlib.sha256(numpy.ascontiguousarray(value).tobytes()).hexdigest())
+    if hasattr(value,"tolist"):
+        return(value.tolist())
+    return(str(value))
+
+def filedigest(path):
+    """SHA-256 of a file's contents, for settings that name a file (e.g. warm-start heads)."""
+    digest = hashlib.sha256()
+    localfile = open(path,"rb")
+    for block in iter(lambda: localfile.read(1 << 20),b""):
+        digest.update(block)
+    localfile.close()
+    return("sha256:" + digest.hexdigest())
+
+def modelkey(model,kind,settings=None):
+    """Hex SHA-256 of the model definition, the kind of result and the settings that produce it."""
+    arrays = list(gwmodel.BINARYARRAYS)
+    header = {"version":CACHEVERSION,"kind":kind,"settings":settings or {}}
+    for name in gwmodel.BINARYSCALARS:
+        header[name] = numpy.asarray(model[name]).tolist()
+    if "nlayers" in model:
+        header["nlayers"] = model["nlayers"]
+        arrays.append("leakance")
+    digest = hashlib.sha256(json.dumps(header,sort_keys=True,default=jsonvalue).encode())
+    for name in arrays:
+        dtype = numpy.int64 if name.startswith("boundary") else numpy.float64
+        values = numpy.ascontiguousarray(model[name],dtype=dtype)
+        digest.update((name + str(values.shape)).encode())
+        digest.update(values.tobytes())
+    return(digest.hexdigest())
+
+def entrypath(key,cachedir=None):
+    return(os.path.join(cachedirectory(cachedir),key + ".npz"))
+
+def lookup(key,cachedir=None):
+    """Cached (arrays, info) for key, or None; a hit marks the entry as most recently used."""
+    path = entrypath(key,cachedir)
+    try:
+        data = numpy.load(path,allow_pickle=False)
+        arrays = {name:data[name] for name in data.files if name != "info"}
+        info = json.loads(str(data["info"]))
+        data.close()
+    except (OSError,ValueError,KeyError,EOFError,zipfile.BadZipFile):
+        # missing, or a damaged entry: treat as a miss
+        return(None)
+    os.utime(path)
+    return(arrays,info)
+
+def store(key,arrays,info=None,cachedir=None,maxbytes=None):
+    """Write an entry (dict of arrays, JSON-able info) atomically, then evict down to maxbytes; returns its path."""
+    import tempfile
+    cachedir = cachedirectory(cachedir)
+    os.makedirs(cachedir,exist_ok=True)
+    path = entrypath(key,cachedir)
+    handle,temporary = tempfile.mkstemp(dir=cachedir,suffix=".tmp")
+    localfile = os.fdopen(handle,"wb")
+    numpy.savez(localfile,info=numpy.array(json.dumps(info or {},default=jsonvalue)),**arrays)
+    localfile.close()
+    # readers see the old entry or the new one, never half a file
+    os.replace(temporary,path)
+    evict(cachedir,maxbytes,keep=path)
+    return(path)
+
+def evict(cachedir=None,maxbytes=None,keep=None):
+    """Delete least recently used entries until the directory holds at most maxbytes; returns the number deleted."""
+    cachedir = cachedirectory(cachedir)
+    if maxbytes is None:
+        maxbytes = MAXBYTES
+    entries = []
+    for name in os.listdir(cachedir):
+        if name.endswith(".npz"):
+            status = os.stat(os.path.join(cachedir,name))
+            entries.append((status.st_mtime,status.st_size,os.path.join(cachedir,name)))
+    entries.sort()
+    total = sum(entry[1] for entry in entries)
+    removed = 0
+    for mtime,size,path in entries:
+        if total <= maxbytes:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    return(removed)
+
+def cachedsolve(model,cachedir=None,maxbytes=None,**options):
+    """gwmodel.solve(model, **options) through the cache; returns (head, info) with info["cached"].
+
+    A warm start given as a file name is keyed by the file's contents."""
+    settings = dict(options)
+    if isinstance(settings.get("start"),str):
+        settings["start"] = filedigest(settings["start"])
+    key = modelkey(model,"solve",settings)
+    hit = lookup(key,cachedir)
+    if hit is not None:
+        arrays,info = hit
+        info["cached"] = True
+        return(arrays["head"],info)
+    head,info = gwmodel.solve(model,**options)
+    store(key,{"head":head},info,cachedir,maxbytes)
+    info["cached"] = False
+    return(head,info)
+
+def cachedinfluence(model,wells,cells=None,rate=1.0e6,cachedir=None,maxbytes=None,**options):
+    """gwmodel.influence(model, wells, cells, rate, **options) through the cache; returns ddn."""
+    settings = dict(options)
+    settings.update({"wells":[list(well) for well in wells],"rate":rate,
+                     "cells":None if cells is None else [list(cell) for cell in cells]})
+    key = modelkey(model,"influence",settings)
+    hit = lookup(key,cachedir)
+    if hit is not None:
+        return(hit[0]["ddn"])
+    ddn = gwmodel.influence(model,wells,cells,rate,**options)
+    store(key,{"ddn":ddn},{"wells":len(wells)},cachedir,maxbytes)
+    return(ddn)
@@ -0,0 +1,25 @@
+# Convert 2D-SteadyConfinedJacobi.py text input files to binary model directories
+# (header.json plus one .npy file per array, see gwmodel.writebinary).  The
+# directory name can be given to the script on stdin in place of the text
+# file with any of the array solvers (--solver jacobi, sor, direct, cg, ...).
+import argparse
+import os
+import gwmodel
+
+def convert(infile,outdir=None):
+    """Write the text input file infile as a binary model directory; returns the directory name."""
+    if outdir is None:
+        outdir = os.path.splitext(infile)[0] + ".gw"
+    gwmodel.writebinary(gwmodel.readmodel(infile),outdir)
+    return(outdir)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="convert text model input files to binary model directories")
+    parser.add_argument("infiles",nargs="+",help="text input files, e.g. base-case.txt")
+    parser.add_argument("--outdir",default=None,
+                        help="output directory for a single input file (default: input name with .gw for .txt)")
+    args = parser.parse_args()
+    if args.outdir is not None and len(args.infiles) > 1:
+        parser.error("--outdir needs a single input file")
+    for infile in args.infiles:
+        print(infile,"->",convert(infile,args.outdir))
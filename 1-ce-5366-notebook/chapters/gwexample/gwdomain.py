@@ -0,0 +1,246 @@
+# Domain-decomposed parallel solve for the 2D groundwater model
+# Companion to gwmodel.py.  The interior rows are split into horizontal
+# strips, one per worker process.  Every vector of the outer iteration
+# (heads, residual, search direction, ...) lives once in shared memory in
+# the interior numbering of gwmodel.assemble, where a strip is a contiguous
+# range, so halo exchange is just reading the neighbouring rows.  Each
+# worker factors its strip, widened by overlap rows on either side, once.
+# The outer iteration is conjugate gradients preconditioned by additive
+# Schwarz: every worker solves its widened strip for the current residual
+# and the overlapping pieces are summed (overlap 0 is block Jacobi).
+# One-level Schwarz only passes information a strip per iteration, so its
+# outer iterations grow with the number of strips (28/45/59/81 for 2/4/8/16
+# workers on a 400 x 200 grid, overlap 2).  The preconditioner therefore
+# adds a coarse correction P Ac^-1 P'r (two-level additive Schwarz), with
+# P the composite prolongation of gwmultigrid down to a coarse grid of
+# about coarse unknowns and Ac = P'AP its Galerkin operator: each worker
+# restricts its own rows of r during SCHWARZ, the parent adds the pieces
+# and solves the small coarse system, and each worker prolongs the
+# coarse solution onto its own rows during COMBINE.
+# Workers also do the matrix-vector products, vector updates and partial
+# dot products of their own rows, so the parent process only adds up
+# 3 numbers per worker per iteration, plus the coarse solve.
+# A worker that fails aborts the shared barrier, and the parent also
+# watches that every worker is still alive (a killed worker cannot abort
+# anything), so a lost worker ends the solve with a RuntimeError instead
+# of leaving the others waiting at the barrier forever.
+import numpy
+import gwmodel
+
+# phases of one CG iteration, run by every worker between two barriers
+MATVEC = 1    # p = z + beta p on own rows                  (before the product)
+PRODUCT = 2   # q = A p on own rows, partial p.q
+UPDATE = 3    # x += alpha p, r -= alpha q, partial r.r
+SCHWARZ = 4   # solve the widened strip for r into the even/odd buffer, restrict own rows of r
+COMBINE = 5   # z = even + odd + P yc on own rows, partial r.z
+STOP = 9
+VECTORS = ["b","x","r","p","q","z","even","odd"]
+
+def strips(m,nworkers,overlap):
+    """Owned (r0, r1) and widened (e0, e1) interior row ranges of each worker's strip."""
+    edges = numpy.linspace(0,m,nworkers + 1).round().astype(int)
+    ranges = []
+    for k in range(nworkers):
+        r0,r1 = int(edges[k]),int(edges[k + 1])
+        ranges.append((r0,r1,max(0,r0 - overlap),min(m,r1 + overlap)))
+    return(ranges)
+
+def attach(name,size,count):
+    """Shared-memory block as a (count, size) float64 array; returns (block, array)."""
+    from multiprocessing import shared_memory
+    block = shared_memory.SharedMemory(name=name)
+    return(block,numpy.ndarray((count,size),dtype=numpy.float64,buffer=block.buf))
+
+def worker(k,name,size,nworkers,own,rows,local,control,partial,barrier,coarsename=None,prolong=None):
+    """Worker process: factor the widened strip, then run phases until STOP; any failure aborts the barrier.
+
+    prolong holds the own rows of the coarse prolongation (None without
+    a coarse level); row k of the coarse block takes this worker's
+    restriction, the last row the coarse solution."""
+    import threading
+    block,vectors = attach(name,size,len(VECTORS))
+    b,x,r,p,q,z,even,odd = vectors
+    mine = even if k % 2 == 0 else odd
+    if prolong is not None:
+        coarseblock,coarse = attach(coarsename,prolong.shape[1],nworkers + 1)
+        restrict = prolong.T.tocsr()
+    try:
+        factor = gwmodel.factorize(local)
+        s,e,es,ee,lo = own
+        while True:
+            barrier.wait()
+            command = int(control[0])
+            if command == STOP:
+                break
+            if command == MATVEC:
+                p[s:e] = z[s:e] + control[2]*p[s:e]
+            elif command == PRODUCT:
+                # rows of A for own cells, columns from one row above to one row below
+                q[s:e] = rows @ p[lo:lo + rows.shape[1]]
+                partial[k] = p[s:e] @ q[s:e]
+            elif command == UPDATE:
+                x[s:e] += control[1]*p[s:e]
+                r[s:e] -= control[1]*q[s:e]
+                partial[k] = r[s:e] @ r[s:e]
+            elif command == SCHWARZ:
+                mine[es:ee] = factor.solve(r[es:ee])
+                if prolong is not None:
+                    coarse[k] = restrict @ r[s:e]
+            elif command == COMBINE:
+                z[s:e] = even[s:e] + odd[s:e]
+                if prolong is not None:
+                    z[s:e] += prolong @ coarse[nworkers]
+                partial[k] = r[s:e] @ z[s:e]
+            barrier.wait()
+    except threading.BrokenBarrierError:
+        # another worker or the parent gave up; nothing to report from here
+        pass
+    except BaseException:
+        barrier.abort()
+        raise
+    finally:
+        del b,x,r,p,q,z,even,odd,vectors,mine
+        block.close()
+        if prolong is not None:
+            del coarse
+            coarseblock.close()
+
+def ddsolve(model,nworkers=4,overlap=2,coarse=None,tolerance=None,maxiter=None,timeout=None,verbose=False):
+    """Parallel steady solve by strip domain decomposition; returns (head, info).
+
+    nworkers processes each own a strip of interior rows; overlap is the
+    number of extra rows on each side of a strip in its local solve
+    (0 gives block Jacobi, more gives additive Schwarz with fewer outer
+    iterations but larger local factors).  coarse is the size of the
+    coarse problem of the two-level preconditioner in unknowns (default
+    64 per worker; 0 gives one-level Schwarz).  The outer CG stops on the
+    relative residual ||b - A h||/||b|| (tolerance, default 1e-10).
+    info holds outer iterations, residual history, and the setup
+    (assembly, local factorizations) and iteration times.  A worker that
+    fails or dies raises RuntimeError; timeout (seconds, default none)
+    bounds every wait for the workers, including their factorizations."""
+    import gwmultigrid
+    import time
+    import threading
+    import multiprocessing
+    from multiprocessing import shared_memory
+    if tolerance is None:
+        tolerance = 1.0e-10
+    if maxiter is None:
+        maxiter = model["maxiter"]
+    start = time.perf_counter()
+    m = model["nrows"] - 2
+    n = model["ncols"] - 2
+    # strips at least 2*overlap rows high, so same-parity widened strips never overlap
+    nworkers = max(1,min(nworkers,m//max(1,2*overlap)))
+    if coarse is None:
+        coarse = 64*nworkers
+    size = m*n
+    matrix,rhs = gwmodel.assemble(model)
+    prolong = None
+    if coarse > 0 and nworkers > 1:
+        # composite prolongation to the multigrid level with at most coarse unknowns
+        levels = gwmultigrid.buildhierarchy(model,matrix,coarsest=coarse)
+        if len(levels) > 1:
+            prolong = levels[0]["prolong"]
+            for level in levels[1:-1]:
+                prolong = (prolong @ level["prolong"]).tocsr()
+            coarsefactor = levels[-1]["factor"]
+    ncoarse = 0 if prolong is None else prolong.shape[1]
+    block = shared_memory.SharedMemory(create=True,size=len(VECTORS)*size*8)
+    # per-worker restrictions and the coarse solution
+    coarseblock = shared_memory.SharedMemory(create=True,size=max(1,(nworkers + 1)*ncoarse*8))
+    coarsevectors = numpy.ndarray((nworkers + 1,ncoarse),dtype=numpy.float64,buffer=coarseblock.buf)
+    vectors = numpy.ndarray((len(VECTORS),size),dtype=numpy.float64,buffer=block.buf)
+    vectors[:,:] = 0.0
+    b,x,r,p,q,z,even,odd = vectors
+    b[:] = rhs
+    x[:] = numpy.asarray(model["head"],dtype=numpy.float64)[1:-1,1:-1].ravel()
+    r[:] = b - matrix @ x
+    control = multiprocessing.Array("d",3,lock=False)
+    partial = multiprocessing.Array("d",nworkers,lock=False)
+    barrier = multiprocessing.Barrier(nworkers + 1)
+    processes = []
+    finished = threading.Event()
+    def watch():
+        # a killed worker never reaches the barrier; break it for everybody else
+        while not finished.wait(0.5):
+            if any(not process.is_alive() for process in processes):
+                barrier.abort()
+                return
+    for k,(r0,r1,e0,e1) in enumerate(strips(m,nworkers,overlap)):
+        lo = max(0,r0 - 1)*n
+        hi = min(m,r1 + 1)*n
+        rows = matrix[r0*n:r1*n,lo:hi].tocsr()
+        local = matrix[e0*n:e1*n,e0*n:e1*n].tocsc()
+        own = (r0*n,r1*n,e0*n,e1*n,lo)
+        ownprolong = None if prolong is None else prolong[r0*n:r1*n,:].tocsr()
+        process = multiprocessing.Process(target=worker,args=(k,block.name,size,nworkers,own,rows,local,
+                                                                  control,partial,barrier,coarseblock.name,ownprolong))
+        process.start()
+        processes.append(process)
+    watcher = threading.Thread(target=watch,daemon=True)
+    watcher.start()
+    def phase(command,alpha=0.0,beta=0.0):
+        control[0] = command
+        control[1] = alpha
+        control[2] = beta
+        try:
+            barrier.wait(timeout)
+            barrier.wait(timeout)
+        except threading.BrokenBarrierError:
+            codes = [process.exitcode for process in processes]
+            raise RuntimeError("domain decomposition worker failed or timed out (exit codes " + str(codes) + ")")
+        return(float(sum(partial)))
+    def schwarz():
+        # local solves and restriction in the workers, then the coarse solve here
+        phase(SCHWARZ)
+        if prolong is not None:
+            coarsevectors[nworkers] = coarsefactor.solve(coarsevectors[:nworkers].sum(axis=0))
+    try:
+        bnorm = numpy.linalg.norm(b) or 1.0
+        history = [float(numpy.linalg.norm(r)/bnorm)]
+        # the first phase also waits for every worker's factorization
+        schwarz()
+        setup = time.perf_counter() - start
+        start = time.perf_counter()
+        rz = phase(COMBINE)
+        beta = 0.0
+        iter = 0
+        while history[-1] > tolerance and iter < maxiter:
+            iter += 1
+            phase(MATVEC,beta=beta)
+            alpha = rz/phase(PRODUCT)
+            history.append(float(numpy.sqrt(phase(UPDATE,alpha=alpha))/bnorm))
+            if verbose:
+                print("outer iteration",iter,"residual",history[-1])
+            if history[-1] <= tolerance:
+                break
+            schwarz()
+            rznew = phase(COMBINE)
+            beta = rznew/rz
+            rz = rznew
+        iterate = time.perf_counter() - start
+        head = numpy.array(model["head"],dtype=numpy.float64)
+        head[1:-1,1:-1] = x.reshape(m,n)
+    finally:
+        finished.set()
+        watcher.join()
+        control[0] = STOP
+        try:
+            barrier.wait(timeout=60)
+        except threading.BrokenBarrierError:
+            barrier.abort()
+            for process in processes:
+                process.terminate()
+        for process in processes:
+            process.join()
+        del b,x,r,p,q,z,even,odd,vectors,coarsevectors
+        block.close()
+        block.unlink()
+        coarseblock.close()
+        coarseblock.unlink()
+    gwmodel.applyboundary(head,model)
+    info = {"iterations":iter,"closure":history[-1],"residual":history[-1],"converged":history[-1] <= tolerance,
+            "history":history,"workers":nworkers,"coarse":ncoarse,"setup":setup,"iterate":iterate}
+    return(head,info)
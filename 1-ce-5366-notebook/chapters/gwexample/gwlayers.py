@@ -0,0 +1,145 @@
+# Multi-layer (quasi-3D) confined flow for the 2D groundwater model
+# Companion to gwmodel.py.  A layered model has the same keys as a one-layer
+# model, but head, hydcondx, hydcondy and pumping are contiguous
+# (nlayers, nrows, ncols) arrays, deltaz holds one thickness per layer, and
+# leakance (nlayers-1, nrows, ncols) is the vertical conductance per unit
+# area (1/day, Kv'/b' of the aquitard) between layer k and k+1.  Every layer
+# shares the boundary flags; fixed heads come from each layer's own ring.
+# Aquitards are not modelled as layers (quasi-3D): leakage between layers
+# k and k+1 is leakance*(h[k+1] - h[k]) per unit area.
+# Each layer keeps the five-point stencil of gwmodel, with its leakance to
+# the layers above and below added to the diagonal (the stencil's
+# "storage" term); the layers are then coupled by diagonal blocks.
+import numpy
+import gwmodel
+
+def stacklayers(models,leakance):
+    """Layered model from one-layer models (top first) sharing grid and boundary flags."""
+    model = dict(models[0])
+    for other in models[1:]:
+        for name in ["deltax","deltay","nrows","ncols"]:
+            if other[name] != model[name]:
+                raise ValueError("layers differ in " + name)
+        for name in ["boundarytop","boundarybottom","boundaryleft","boundaryright"]:
+            if not numpy.array_equal(other[name],model[name]):
+                raise ValueError("layers differ in " + name)
+    model["nlayers"] = len(models)
+    model["deltaz"] = numpy.array([other["deltaz"] for other in models],dtype=numpy.float64)
+    for name in ["head","hydcondx","hydcondy","pumping"]:
+        model[name] = numpy.ascontiguousarray(numpy.stack([other[name] for other in models]),dtype=numpy.float64)
+    leak = numpy.zeros((len(models) - 1,model["nrows"],model["ncols"]))
+    leak[:,:,:] = leakance
+    model["leakance"] = leak
+    return(model)
+
+def layermodel(model,k):
+    """One-layer view of layer k of a layered model."""
+    layer = dict(model)
+    layer["deltaz"] = float(model["deltaz"][k])
+    for name in ["head","hydcondx","hydcondy","pumping"]:
+        layer[name] = model[name][k]
+    return(layer)
+
+def verticalleakance(model):
+    """Leakance arrays zeroed on the boundary ring, where the layers are not solved."""
+    leak = numpy.zeros_like(numpy.asarray(model["leakance"],dtype=numpy.float64))
+    leak[:,1:-1,1:-1] = numpy.asarray(model["leakance"],dtype=numpy.float64)[:,1:-1,1:-1]
+    return(leak)
+
+def layerstencils(model):
+    """Closed stencil of every layer with its leakance to the neighbouring layers on the diagonal."""
+    leak = verticalleakance(model)
+    stencils = []
+    for k in range(model["nlayers"]):
+        layer = layermodel(model,k)
+        stencil = gwmodel.closeboundary(gwmodel.buildstencil(layer),layer)
+        storage = numpy.zeros((model["nrows"],model["ncols"]))
+        if k > 0:
+            storage += leak[k - 1]
+        if k < model["nlayers"] - 1:
+            storage += leak[k]
+        stencil["storage"] = storage
+        stencils.append(gwmodel.packstencil(stencil))
+    return(stencils,leak)
+
+def applyoperator(x,stencils,leak,out):
+    """out = A x for the stacked system; x is (nlayers, nrows, ncols) and zero on every ring."""
+    for k in range(len(stencils)):
+        gwmodel.applyoperator(x[k],stencils[k],out[k])
+    # leak is zero on the ring, so whole-layer products leave the ring alone
+    out[1:] -= leak*x[:-1]
+    out[:-1] -= leak*x[1:]
+    return(out)
+
+def buildrhs(model,stencils):
+    """Right-hand side of every layer's interior balance, (nlayers, nrows-2, ncols-2)."""
+    return(numpy.stack([gwmodel.buildrhs(layermodel(model,k),stencils[k]) for k in range(len(stencils))]))
+
+def assemble(model,stencils=None):
+    """Sparse system A h = rhs of the stacked layers; unknowns are numbered layer, row, column.
+
+    Each layer block is gwmodel.assemble of its stencil; the leakance
+    couples cell p of layer k with cell p of layer k+1, i.e. the diagonals
+    at offsets +-(nrows-2)*(ncols-2)."""
+    import scipy.sparse
+    if stencils is None:
+        stencils,leak = layerstencils(model)
+    else:
+        leak = verticalleakance(model)
+    blocks = []
+    for k in range(len(stencils)):
+        matrix,rhs = gwmodel.assemble(layermodel(model,k),stencils[k])
+        blocks.append(matrix)
+    matrix = scipy.sparse.block_diag(blocks,format="csr")
+    if len(stencils) > 1:
+        coupling = -leak[:,1:-1,1:-1].ravel()
+        size = leak[0,1:-1,1:-1].size
+        matrix = (matrix + scipy.sparse.diags([coupling,coupling],[size,-size],shape=matrix.shape)).tocsr()
+    return(matrix,buildrhs(model,stencils).ravel())
+
+def solve(model,solver="direct",precond="ic",tolerance=None,maxiter=None,verbose=False):
+    """Steady heads of a layered model; returns (head, info) with head (nlayers, nrows, ncols).
+
+    solver "direct" factors the assembled system (gwmodel.factorize);
+    "cg" runs matrix-free conjugate gradients with a block preconditioner
+    (IC(0) or Jacobi of each layer's own stencil, leakance included)
+    and stops on the relative residual (tolerance, default 1e-10)."""
+    import time
+    nlayers = model["nlayers"]
+    nrows = model["nrows"]
+    ncols = model["ncols"]
+    if tolerance is None:
+        tolerance = 1.0e-10
+    if maxiter is None:
+        maxiter = model["maxiter"]
+    start = time.perf_counter()
+    stencils,leak = layerstencils(model)
+    head = numpy.array(model["head"],dtype=numpy.float64)
+    if solver == "direct":
+        matrix,rhs = assemble(model,stencils)
+        factor = gwmodel.factorize(matrix)
+        setup = time.perf_counter() - start
+        head[:,1:-1,1:-1] = factor.solve(rhs).reshape(nlayers,nrows - 2,ncols - 2)
+        info = {"iterations":1,"closure":0.0,"converged":True}
+    elif solver == "cg":
+        applies = [gwmodel.preconditioner(layermodel(model,k),stencils[k],precond) for k in range(nlayers)]
+        def apply(r,z):
+            for k in range(nlayers):
+                applies[k](r[k],z[k])
+            return(z)
+        def operator(v,out):
+            return(applyoperator(v,stencils,leak,out))
+        rhs = numpy.zeros((nlayers,nrows,ncols))
+        rhs[:,1:-1,1:-1] = buildrhs(model,stencils)
+        x = numpy.zeros((nlayers,nrows,ncols))
+        x[:,1:-1,1:-1] = head[:,1:-1,1:-1]
+        setup = time.perf_counter() - start
+        x,info = gwmodel.pcg(None,rhs,x,apply,"residual",tolerance,maxiter,verbose,operator=operator)
+        head[:,1:-1,1:-1] = x[:,1:-1,1:-1]
+    else:
+        raise ValueError("unknown layered solver: " + str(solver))
+    for k in range(nlayers):
+        gwmodel.applyboundary(head[k],model)
+    info["setup"] = setup
+    info["solve"] = time.perf_counter() - start - setup
+    return(head,info)
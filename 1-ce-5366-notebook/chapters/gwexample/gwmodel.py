@@ -0,0 +1,1217 @@
+# 2D steady confined groundwater model -- NumPy array engine
+# Companion module to 2D-SteadyConfinedJacobi.py.  Same input layout, same
+# five-point stencil (amat..dmat, qrat) and same no-flow/fixed-head boundary
+# handling, but head, conductance and pumping are held in contiguous float64
+# arrays and every sweep is done with whole-array slice operations.
+import numpy
+
+# binary model directory: header.json with the scalars plus one .npy file per array
+BINARYSCALARS = ["deltax","deltay","deltaz","nrows","ncols","tolerance","maxiter"]
+BINARYARRAYS = ["distancex","distancey","boundarytop","boundarybottom","boundaryleft","boundaryright",
+                "head","hydcondx","hydcondy","pumping"]
+# stopping tests of the iterative sweeps, see convergencemeasures
+CRITERIA = ["sse","maxchange","residual","massbalance"]
+# head output formats and their file extensions
+HEADFORMATS = {"text":".out","f64":".f64","f32":".f32","npy":".npy","gwz":".gwz"}
+# coefficient planes of a packed stencil, in order, see packstencil
+STENCILFIELDS = ["amat","bmat","cmat","dmat","qrat","storage"]
+
+def readmodel(infile,mmap=True):
+    """Read a 2D-SteadyConfinedJacobi.py input file into a model dictionary.
+
+    infile may also be a binary model directory written by writebinary,
+    which is loaded with readbinary instead of being parsed."""
+    import os
+    if os.path.isdir(infile):
+        return(readbinary(infile,mmap))
+    localfile = open(infile,"r") # connect and read file for 2D gw model
+    model = {}
+    model["deltax"] = float(localfile.readline())
+    model["deltay"] = float(localfile.readline())
+    model["deltaz"] = float(localfile.readline())
+    nrows = int(localfile.readline())
+    ncols = int(localfile.readline())
+    model["nrows"] = nrows
+    model["ncols"] = ncols
+    model["tolerance"] = float(localfile.readline())
+    model["maxiter"] = int(localfile.readline())
+    model["distancex"] = numpy.array(localfile.readline().split(),dtype=numpy.float64)
+    model["distancey"] = numpy.array(localfile.readline().split(),dtype=numpy.float64)
+    for side in ["boundarytop","boundarybottom","boundaryleft","boundaryright"]:
+        model[side] = numpy.array([int(float(n)) for n in localfile.readline().split()])
+    for name in ["head","hydcondx","hydcondy","pumping"]:
+        block = numpy.empty((nrows,ncols),dtype=numpy.float64)
+        for irow in range(nrows):
+            block[irow,:] = localfile.readline().split()
+        model[name] = block
+    localfile.close() # Disconnect the file
+    return(model)
+
+def writebinary(model,directory):
+    """Write a model as a binary model directory: header.json plus one .npy file per array.
+
+    Layered models (gwlayers) add nlayers to the header, keep deltaz as a
+    list there and write leakance.npy."""
+    import json
+    import os
+    os.makedirs(directory,exist_ok=True)
+    header = {"format":"gwmodel-binary","version":1}
+    for name in BINARYSCALARS:
+        header[name] = model[name]
+    arrays = list(BINARYARRAYS)
+    if "nlayers" in model:
+        header["nlayers"] = model["nlayers"]
+        header["deltaz"] = [float(dz) for dz in model["deltaz"]]
+        arrays.append("leakance")
+    for name in arrays:
+        dtype = numpy.int64 if name.startswith("boundary") else numpy.float64
+        numpy.save(os.path.join(directory,name + ".npy"),numpy.ascontiguousarray(model[name],dtype=dtype))
+    # header last, so a directory with a header is complete
+    localfile = open(os.path.join(directory,"header.json"),"w")
+    json.dump(header,localfile,indent=1)
+    localfile.close()
+    return(directory)
+
+def readbinary(directory,mmap=True):
+    """Load a binary model directory; with mmap the arrays are read-only memory maps.
+
+    Nothing is parsed, and processes that map the same files share one
+    copy of the conductivity and pumping fields through the page cache."""
+    import json
+    import os
+    localfile = open(os.path.join(directory,"header.json"),"r")
+    header = json.load(localfile)
+    localfile.close()
+    if header.get("format") != "gwmodel-binary":
+        raise ValueError(directory + ": not a binary model directory")
+    model = {}
+    for name in BINARYSCALARS:
+        model[name] = header[name]
+    arrays = list(BINARYARRAYS)
+    shape = (model["nrows"],model["ncols"])
+    if "nlayers" in header:
+        model["nlayers"] = header["nlayers"]
+        model["deltaz"] = numpy.array(header["deltaz"],dtype=numpy.float64)
+        arrays.append("leakance")
+        shape = (model["nlayers"],) + shape
+    for name in arrays:
+        model[name] = numpy.load(os.path.join(directory,name + ".npy"),mmap_mode="r" if mmap else None)
+    if model["head"].shape != shape:
+        raise ValueError(directory + ": arrays do not match nrows, ncols in header.json")
+    return(model)
+
+def writehead(head,outfile,format="text",label=None,chunkrows=64):
+    """Write a head field row by row in one of HEADFORMATS; returns outfile.
+
+    "text" is the script's .out layout (label line, then str() of every
+    value), "f64"/"f32" raw little-endian row-major binary with no header,
+    "npy" a NumPy .npy file, and "gwz" a chunked zlib format: b"GWZ1",
+    int64 nrows, ncols, chunkrows, then each chunk of chunkrows float64
+    rows as an int64 byte count and its compressed bytes.  head may be an
+    array or a list of rows; only one row (or chunk) is converted at a time."""
+    nrows = len(head)
+    ncols = len(head[0])
+    if format == "text":
+        localfile = open(outfile,"w")
+        localfile.writelines((outfile if label is None else label)+'\n')
+        for row in range(nrows):
+            localfile.write(" ".join(map(str,head[row]))+"\n")
+        localfile.close()
+        return(outfile)
+    localfile = open(outfile,"wb")
+    if format in ["f64","f32","npy"]:
+        dtype = numpy.dtype("<f4") if format == "f32" else numpy.dtype("<f8")
+        if format == "npy":
+            numpy.lib.format.write_array_header_1_0(localfile,{"descr":dtype.str,"fortran_order":False,
+                                                               "shape":(nrows,ncols)})
+        for row in range(nrows):
+            localfile.write(numpy.asarray(head[row],dtype=dtype).tobytes())
+    elif format == "gwz":
+        import zlib
+        localfile.write(b"GWZ1" + numpy.array([nrows,ncols,chunkrows],dtype="<i8").tobytes())
+        for first in range(0,nrows,chunkrows):
+            chunk = numpy.asarray(head[first:first + chunkrows],dtype="<f8")
+            data = zlib.compress(chunk.tobytes(),6)
+            localfile.write(numpy.array([len(data)],dtype="<i8").tobytes() + data)
+    else:
+        localfile.close()
+        raise ValueError("unknown head format: " + str(format))
+    localfile.close()
+    return(outfile)
+
+def readhead(infile,format=None,shape=None):
+    """Read a head field written by writehead (or by the script); returns a float64 array.
+
+    format defaults from the file extension (HEADFORMATS); raw "f64" and
+    "f32" files carry no shape, so shape=(nrows, ncols) is needed."""
+    if format is None:
+        format = "text"
+        for name,extension in HEADFORMATS.items():
+            if infile.endswith(extension):
+                format = name
+    if format == "text":
+        return(numpy.loadtxt(infile,skiprows=1,ndmin=2))
+    elif format in ["f64","f32"]:
+        if shape is None:
+            raise ValueError(infile + ": raw " + format + " heads need shape=(nrows, ncols)")
+        return(numpy.fromfile(infile,dtype="<f4" if format == "f32" else "<f8").astype(numpy.float64).reshape(shape))
+    elif format == "npy":
+        return(numpy.load(infile).astype(numpy.float64))
+    elif format == "gwz":
+        import zlib
+        localfile = open(infile,"rb")
+        if localfile.read(4) != b"GWZ1":
+            localfile.close()
+            raise ValueError(infile + ": not a gwz head file")
+        nrows,ncols,chunkrows = numpy.frombuffer(localfile.read(24),dtype="<i8")
+        head = numpy.empty((nrows,ncols))
+        for first in range(0,nrows,chunkrows):
+            size = int(numpy.frombuffer(localfile.read(8),dtype="<i8")[0])
+            rows = head[first:first + chunkrows]
+            rows[:,:] = numpy.frombuffer(zlib.decompress(localfile.read(size)),dtype="<f8").reshape(rows.shape)
+        localfile.close()
+        return(head)
+    raise ValueError("unknown head format: " + str(format))
+
+def buildstencil(model):
+    """Transmissivity (amat..dmat) and net pumping (qrat) arrays, as in the script."""
+    nrows = model["nrows"]
+    ncols = model["ncols"]
+    deltax = model["deltax"]
+    deltay = model["deltay"]
+    deltaz = model["deltaz"]
+    kx = numpy.asarray(model["hydcondx"],dtype=numpy.float64)
+    ky = numpy.asarray(model["hydcondy"],dtype=numpy.float64)
+    stencil = {}
+    for name in ["amat","bmat","cmat","dmat"]:
+        stencil[name] = numpy.zeros((nrows,ncols))
+    stencil["amat"][1:-1,1:-1] = ((kx[:-2,1:-1] + kx[1:-1,1:-1])*deltaz)/(2.0*deltax**2)
+    stencil["bmat"][1:-1,1:-1] = ((kx[1:-1,1:-1] + kx[2:,1:-1])*deltaz)/(2.0*deltax**2)
+    stencil["cmat"][1:-1,1:-1] = ((ky[1:-1,:-2] + ky[1:-1,1:-1])*deltaz)/(2.0*deltay**2)
+    stencil["dmat"][1:-1,1:-1] = ((ky[1:-1,1:-1] + ky[1:-1,2:])*deltaz)/(2.0*deltay**2)
+    stencil["qrat"] = numpy.asarray(model["pumping"],dtype=numpy.float64)/(deltax*deltay)/365.0
+    return(packstencil(stencil))
+
+def packstencil(stencil,dtype=numpy.float64):
+    """Copy of stencil with its coefficient planes packed into one contiguous array, plus diag and invdiag.
+
+    stencil["packed"] is a (nplanes, nrows, ncols) array holding the
+    STENCILFIELDS present (amat..qrat, and storage for a transient or
+    layered stencil), then the diagonal and its inverse; stencil[name] are
+    views of its planes.  invdiag is 0 where the diagonal is 0 (the
+    boundary ring), so sweeps multiply by it instead of summing and
+    dividing at every cell update.  Code that changes the coefficients in
+    place must call updatediagonal() afterwards.  dtype numpy.float32 gives
+    the single-precision copy used by mixedsolve()."""
+    names = [name for name in STENCILFIELDS if name in stencil]
+    shape = numpy.shape(stencil["amat"])
+    packed = numpy.empty((len(names) + 2,) + shape,dtype=dtype)
+    result = dict(stencil)
+    for k,name in enumerate(names):
+        packed[k] = stencil[name]
+        result[name] = packed[k]
+    result["diag"] = packed[-2]
+    result["invdiag"] = packed[-1]
+    result["packed"] = packed
+    return(updatediagonal(result))
+
+def updatediagonal(stencil):
+    """Refill the diag and invdiag planes of a packed stencil from its coefficients; returns stencil."""
+    stencil["diag"][...] = diagonal(stencil)
+    stencil["invdiag"][...] = 0.0
+    numpy.divide(1.0,stencil["diag"],out=stencil["invdiag"],where=stencil["diag"] != 0.0)
+    return(stencil)
+
+def applyboundary(head,model):
+    """No-flow boundaries copy the adjacent interior head; fixed heads are left alone."""
+    top = numpy.asarray(model["boundarytop"]) == 0
+    bottom = numpy.asarray(model["boundarybottom"]) == 0
+    left = numpy.asarray(model["boundaryleft"]) == 0
+    right = numpy.asarray(model["boundaryright"]) == 0
+    # first and last row, then first and last column -- same order as the script
+    head[0,top] = head[1,top]
+    head[-1,bottom] = head[-2,bottom]
+    head[left,0] = head[left,1]
+    head[right,-1] = head[right,-2]
+    return(head)
+
+def closeboundary(stencil,model):
+    """Copy of stencil with the couplings to no-flow boundary cells removed.
+
+    A no-flow cell holds the head of its interior neighbour, so its term
+    drops out of both sides of the balance; sweeps on the closed stencil
+    need no ghost-cell copies and solve the same system."""
+    closed = packstencil(stencil)
+    closed["amat"][1,numpy.asarray(model["boundarytop"]) == 0] = 0.0
+    closed["bmat"][-2,numpy.asarray(model["boundarybottom"]) == 0] = 0.0
+    closed["cmat"][numpy.asarray(model["boundaryleft"]) == 0,1] = 0.0
+    closed["dmat"][numpy.asarray(model["boundaryright"]) == 0,-2] = 0.0
+    return(updatediagonal(closed))
+
+def jacobisweep(head,stencil,work):
+    """One Jacobi sweep of the interior cells; work holds the previous iterate."""
+    a = stencil["amat"][1:-1,1:-1]
+    b = stencil["bmat"][1:-1,1:-1]
+    c = stencil["cmat"][1:-1,1:-1]
+    d = stencil["dmat"][1:-1,1:-1]
+    work[:,:] = head
+    head[1:-1,1:-1] = (-stencil["qrat"][1:-1,1:-1]
+                       + a*work[:-2,1:-1]
+                       + b*work[2:,1:-1]
+                       + c*work[1:-1,:-2]
+                       + d*work[1:-1,2:])*stencil["invdiag"][1:-1,1:-1]
+    return(head)
+
+def colorslices(nrows,ncols):
+    """Strided (row, column) slices covering the red (0) and black (1) interior cells."""
+    colors = [[],[]]
+    for color in range(2):
+        for p in range(2):
+            q = (color - 1 - p) % 2 # column parity of this color in rows 1+p, 3+p, ...
+            rs = slice(1 + p,nrows - 1,2)
+            cs = slice(2 - q,ncols - 1,2)
+            colors[color].append((rs,cs))
+    return(colors)
+
+def shift(s,offset):
+    return(slice(s.start + offset,s.stop + offset,s.step))
+
+def redblacksweep(head,stencil,colors,omega=1.0):
+    """One red-black Gauss-Seidel sweep on a closed stencil, over-relaxed by omega (omega = 1 is plain Gauss-Seidel)."""
+    for color in range(2):
+        for rs,cs in colors[color]:
+            a = stencil["amat"][rs,cs]
+            b = stencil["bmat"][rs,cs]
+            c = stencil["cmat"][rs,cs]
+            d = stencil["dmat"][rs,cs]
+            gs = (-stencil["qrat"][rs,cs]
+                  + a*head[shift(rs,-1),cs]
+                  + b*head[shift(rs,1),cs]
+                  + c*head[rs,shift(cs,-1)]
+                  + d*head[rs,shift(cs,1)])*stencil["invdiag"][rs,cs]
+            if omega == 1.0:
+                head[rs,cs] = gs
+            else:
+                head[rs,cs] += omega*(gs - head[rs,cs])
+    return(head)
+
+def tileslices(lo,hi,ncols,color):
+    """Strided (row, column) slices of one color's cells in rows lo..hi-1, same coloring as colorslices()."""
+    slices = []
+    for r in range(lo,min(lo + 2,hi)):
+        q = (color - 1 - (r - 1) % 2) % 2
+        slices.append((slice(r,hi,2),slice(2 - q,ncols - 1,2)))
+    return(slices)
+
+def tilerowsfor(ncols,depth,cachebytes=1 << 21):
+    """Default tile height: rows of head, amat..qrat and invdiag that a tile touches fit in cachebytes."""
+    return(max(8,cachebytes//(7*8*ncols) - 2*depth))
+
+def tiledsweep(head,stencil,depth=4,tilerows=None,omega=1.0,previous=None):
+    """depth red-black sweeps in one pass over the grid, tile by tile; same result as depth redblacksweep() calls.
+
+    The interior rows are cut into tiles of tilerows rows.  A tile does all
+    2*depth color half-sweeps before the next tile is touched, so its rows
+    of head and amat..qrat are read from memory once per pass instead of
+    once per sweep.  The tile moves up one row at every half-sweep (a
+    skewed wavefront): a half-sweep of one color reads only the other
+    color, one row up or down, so the rows below the tile are still at the
+    previous half-sweep and the rows above already at this one, exactly as
+    in the untiled order.  If previous is given it receives the heads
+    before the last sweep, for the stopping tests."""
+    nrows,ncols = head.shape
+    if tilerows is None:
+        tilerows = tilerowsfor(ncols,depth)
+    top = nrows - 1
+    half = 2*depth
+    for start in range(1,top + half - 1,tilerows):
+        for h in range(half):
+            lo = max(1,start - h)
+            hi = min(top,start + tilerows - h)
+            if lo >= hi:
+                continue
+            if previous is not None and h == half - 2:
+                previous[lo:hi] = head[lo:hi]
+            for rs,cs in tileslices(lo,hi,ncols,h % 2):
+                a = stencil["amat"][rs,cs]
+                b = stencil["bmat"][rs,cs]
+                c = stencil["cmat"][rs,cs]
+                d = stencil["dmat"][rs,cs]
+                gs = (-stencil["qrat"][rs,cs]
+                      + a*head[shift(rs,-1),cs]
+                      + b*head[shift(rs,1),cs]
+                      + c*head[rs,shift(cs,-1)]
+                      + d*head[rs,shift(cs,1)])*stencil["invdiag"][rs,cs]
+                if omega == 1.0:
+                    head[rs,cs] = gs
+                else:
+                    head[rs,cs] += omega*(gs - head[rs,cs])
+    return(head)
+
+def estimateomega(model,stencil=None,niter=None):
+    """Optimal SOR factor 2/(1+sqrt(1-rho**2)) from an estimate of the Jacobi spectral radius rho.
+
+    rho = 1 - lambda, with lambda the smallest eigenvalue of D^-1 A (D
+    the diagonal), found by niter (default 3) steps of inverse iteration
+    x <- A^-1 D x with one full-multigrid cycle (gwmultigrid) as the
+    solve, and the Rayleigh quotient x'Ax/x'Dx of the last vector.  The
+    two smallest eigenvalues are far apart, so a few steps settle lambda,
+    and the cost is a handful of sweeps whatever the grid size, where
+    power iteration on the Jacobi operator needs thousands of steps on
+    large grids (and an omega estimated short of the optimum costs SOR
+    far more sweeps than it saves)."""
+    import gwmultigrid
+    if stencil is None:
+        stencil = closeboundary(buildstencil(model),model)
+    if niter is None:
+        niter = 3
+    matrix = assemble(model,stencil)[0]
+    levels = gwmultigrid.buildhierarchy(model,matrix)
+    diag = matrix.diagonal()
+    x = numpy.ones(matrix.shape[0])
+    for iter in range(niter):
+        x = gwmultigrid.fmg(levels,diag*x)
+        x /= numpy.abs(x).max()
+    lam = float((x @ (matrix @ x))/(x @ (diag*x)))
+    rho = min(max(1.0 - lam,0.0),1.0 - 1.0e-12)
+    return(float(2.0/(1.0 + numpy.sqrt(1.0 - rho**2))))
+
+def diagonal(stencil):
+    """Diagonal of the closed five-point operator, plus the "storage" term of a transient step if present.
+
+    Computed from the coefficients; a packed stencil keeps it as stencil["diag"]."""
+    diag = stencil["amat"] + stencil["bmat"] + stencil["cmat"] + stencil["dmat"]
+    if "storage" in stencil:
+        diag = diag + stencil["storage"]
+    return(diag)
+
+def buildrhs(model,stencil):
+    """Right-hand side of the interior balance for a closed stencil: -qrat plus fixed boundary heads."""
+    head = numpy.asarray(model["head"],dtype=numpy.float64)
+    a = stencil["amat"][1:-1,1:-1]
+    b = stencil["bmat"][1:-1,1:-1]
+    c = stencil["cmat"][1:-1,1:-1]
+    d = stencil["dmat"][1:-1,1:-1]
+    rhs = -stencil["qrat"][1:-1,1:-1].copy()
+    rhs[0,:] += a[0,:]*head[0,1:-1]
+    rhs[-1,:] += b[-1,:]*head[-1,1:-1]
+    rhs[:,0] += c[:,0]*head[1:-1,0]
+    rhs[:,-1] += d[:,-1]*head[1:-1,-1]
+    return(rhs)
+
+def assemble(model,stencil=None):
+    """Five-point system A h = rhs for the interior cells as a CSR matrix.
+
+    Unknowns are the interior cells numbered row by row; couplings to
+    no-flow cells are closed off and fixed boundary heads move to rhs."""
+    import scipy.sparse
+    if stencil is None:
+        stencil = buildstencil(model)
+    stencil = closeboundary(stencil,model)
+    a = stencil["amat"][1:-1,1:-1]
+    b = stencil["bmat"][1:-1,1:-1]
+    c = stencil["cmat"][1:-1,1:-1]
+    d = stencil["dmat"][1:-1,1:-1]
+    m,n = a.shape
+    idx = numpy.arange(m*n).reshape(m,n)
+    rows = [idx.ravel(),idx[1:,:].ravel(),idx[:-1,:].ravel(),idx[:,1:].ravel(),idx[:,:-1].ravel()]
+    cols = [idx.ravel(),idx[:-1,:].ravel(),idx[1:,:].ravel(),idx[:,:-1].ravel(),idx[:,1:].ravel()]
+    vals = [diagonal(stencil)[1:-1,1:-1].ravel(),-a[1:,:].ravel(),-b[:-1,:].ravel(),-c[:,1:].ravel(),-d[:,:-1].ravel()]
+    matrix = scipy.sparse.csr_matrix((numpy.concatenate(vals),(numpy.concatenate(rows),numpy.concatenate(cols))),shape=(m*n,m*n))
+    rhs = buildrhs(model,stencil)
+    return(matrix,rhs.ravel())
+
+def factorize(matrix):
+    """SuperLU factor of the assembled matrix.
+
+    The matrix is symmetric positive definite, so a minimum-degree ordering
+    on A+A' with diagonal pivots keeps the fill close to a Cholesky factor."""
+    import scipy.sparse.linalg
+    return(scipy.sparse.linalg.splu(matrix.tocsc(),permc_spec="MMD_AT_PLUS_A",
+                                    diag_pivot_thresh=0.0,options={"SymmetricMode":True}))
+
+def directsolve(model,verbose=False):
+    """Sparse LU (SuperLU) solve of the assembled system; returns (head, info)."""
+    import time
+    import scipy.sparse.linalg # import cost is not assembly time
+    start = time.perf_counter()
+    matrix,rhs = assemble(model)
+    assembly = time.perf_counter() - start
+    start = time.perf_counter()
+    factor = factorize(matrix)
+    x = factor.solve(rhs)
+    solvetime = time.perf_counter() - start
+    head = numpy.array(model["head"],dtype=numpy.float64)
+    head[1:-1,1:-1] = x.reshape(model["nrows"] - 2,model["ncols"] - 2)
+    applyboundary(head,model)
+    if verbose:
+        print("assembly",assembly,"s  solve",solvetime,"s  nnz(L+U)",factor.L.nnz + factor.U.nnz)
+    info = {"iterations":1,"closure":0.0,"converged":True,"assembly":assembly,"solve":solvetime}
+    return(head,info)
+
+def applyoperator(x,stencil,out):
+    """Matrix-free product out = A x on grid-shaped arrays; x must be zero on the boundary ring."""
+    a = stencil["amat"][1:-1,1:-1]
+    b = stencil["bmat"][1:-1,1:-1]
+    c = stencil["cmat"][1:-1,1:-1]
+    d = stencil["dmat"][1:-1,1:-1]
+    out[1:-1,1:-1] = (stencil["diag"][1:-1,1:-1]*x[1:-1,1:-1]
+                      - a*x[:-2,1:-1] - b*x[2:,1:-1]
+                      - c*x[1:-1,:-2] - d*x[1:-1,2:])
+    return(out)
+
+def wavefronts(nrows,ncols):
+    """Anti-diagonal (wavefront) ordering of the whole grid, boundary ring included.
+
+    Returns the permutation from flat grid index to wavefront order and, for
+    each anti-diagonal i+j = k holding interior cells, the start and stop of
+    those cells and the starts of their north, west, south and east
+    neighbours.  All five are contiguous runs in wavefront order."""
+    lo = [max(0,k - ncols + 1) for k in range(nrows + ncols - 1)]
+    hi = [min(nrows - 1,k) for k in range(nrows + ncols - 1)]
+    start = numpy.cumsum([0] + [hi[k] - lo[k] + 1 for k in range(len(lo))])
+    perm = numpy.empty(nrows*ncols,dtype=numpy.int64)
+    fronts = []
+    for k in range(len(lo)):
+        i = numpy.arange(lo[k],hi[k] + 1)
+        perm[start[k]:start[k + 1]] = i*ncols + (k - i)
+        i0 = max(1,k - ncols + 2) # interior rows on this front
+        i1 = min(nrows - 2,k - 1)
+        if i1 < i0:
+            continue
+        fronts.append((start[k] + i0 - lo[k],start[k] + i1 + 1 - lo[k],
+                       start[k - 1] + i0 - 1 - lo[k - 1],start[k - 1] + i0 - lo[k - 1],
+                       start[k + 1] + i0 + 1 - lo[k + 1],start[k + 1] + i0 - lo[k + 1]))
+    return(perm,fronts)
+
+def icfactor(stencil):
+    """IC(0) preconditioner of the closed five-point operator, M = (D+L) D^-1 (D+L').
+
+    For the five-point stencil the zero-fill incomplete Cholesky factor
+    keeps L equal to the strictly lower part of A, so only the pivots D
+    have to be computed.  Cell (i,j) needs the pivots of (i-1,j) and
+    (i,j-1), so the work runs one anti-diagonal at a time, on arrays held
+    in wavefront order so that every step is a slice operation."""
+    nrows,ncols = stencil["amat"].shape
+    perm,fronts = wavefronts(nrows,ncols)
+    a = stencil["amat"].ravel()[perm]
+    b = stencil["bmat"].ravel()[perm]
+    c = stencil["cmat"].ravel()[perm]
+    d = stencil["dmat"].ravel()[perm]
+    diag = diagonal(stencil).ravel()[perm]
+    pivot = numpy.full(perm.size,numpy.inf,dtype=diag.dtype) # boundary ring: no coupling
+    for s,e,n,w,so,ea in fronts:
+        ln = e - s
+        pivot[s:e] = (diag[s:e]
+                      - a[s:e]**2/pivot[n:n + ln] - c[s:e]**2/pivot[w:w + ln])
+    pivot[numpy.isinf(pivot)] = 1.0
+    ic = {"perm":perm,"fronts":fronts,"inverse":1.0/pivot,
+          "north":a/pivot,"west":c/pivot,"south":b/pivot,"east":d/pivot,
+          "work":numpy.zeros(perm.size,dtype=diag.dtype)}
+    return(ic)
+
+def icapply(r,ic,z):
+    """z = M^-1 r for the IC(0) preconditioner; forward and back substitution by wavefront."""
+    perm = ic["perm"]
+    inverse = ic["inverse"]
+    north = ic["north"]
+    west = ic["west"]
+    south = ic["south"]
+    east = ic["east"]
+    u = ic["work"] # zero on the boundary ring
+    rw = r.ravel()[perm]
+    for s,e,n,w,so,ea in ic["fronts"]:
+        ln = e - s
+        u[s:e] = rw[s:e]*inverse[s:e] + north[s:e]*u[n:n + ln] + west[s:e]*u[w:w + ln]
+    for s,e,n,w,so,ea in reversed(ic["fronts"]):
+        ln = e - s
+        u[s:e] += south[s:e]*u[so:so + ln] + east[s:e]*u[ea:ea + ln]
+    z.ravel()[perm] = u
+    return(z)
+
+def preconditioner(model,stencil,precond):
+    """Set up a CG preconditioner once; returns apply(r, z) acting on grid-shaped arrays.
+
+    precond is "ic" (incomplete Cholesky), "jacobi" (diagonal),
+    "multigrid" (one V-cycle of gwmultigrid) or None."""
+    shape = stencil["amat"].shape
+    if precond == "ic":
+        ic = icfactor(stencil)
+        def apply(r,z):
+            return(icapply(r,ic,z))
+    elif precond == "jacobi":
+        invdiag = stencil["invdiag"][1:-1,1:-1]
+        def apply(r,z):
+            z[1:-1,1:-1] = r[1:-1,1:-1]*invdiag
+            return(z)
+    elif precond == "multigrid":
+        import gwmultigrid
+        levels = gwmultigrid.buildhierarchy(model,assemble(model,stencil)[0])
+        def apply(r,z):
+            z[1:-1,1:-1] = gwmultigrid.vcycle(levels,r[1:-1,1:-1].ravel()).reshape(shape[0] - 2,shape[1] - 2)
+            return(z)
+    elif precond is None:
+        def apply(r,z):
+            z[:,:] = r
+            return(z)
+    else:
+        raise ValueError("unknown preconditioner: " + str(precond))
+    return(apply)
+
+def pcg(stencil,rhs,x,apply,criterion="residual",tolerance=1.0e-10,maxiter=1000,verbose=False,operator=None):
+    """Preconditioned CG iterations on grid-shaped arrays (zero boundary ring); x is updated in place.
+
+    criterion "residual" stops on ||b - A x||/||b|| <= tolerance, "change"
+    on the sum of squared changes between iterates.  operator(x, out)
+    replaces applyoperator with stencil, e.g. for the stacked layers of
+    gwlayers (arrays of shape (nlayers, nrows, ncols)).  The work arrays
+    take the dtype of x, so float32 x and stencil iterate in single
+    precision.  Returns (x, info)."""
+    if operator is None:
+        def operator(v,out):
+            return(applyoperator(v,stencil,out))
+    shape = x.shape
+    r = numpy.zeros(shape,dtype=x.dtype)
+    z = numpy.zeros(shape,dtype=x.dtype)
+    q = numpy.zeros(shape,dtype=x.dtype)
+    r[...,1:-1,1:-1] = rhs[...,1:-1,1:-1] - operator(x,q)[...,1:-1,1:-1]
+    bnorm = numpy.sqrt((rhs*rhs).sum())
+    if bnorm == 0.0:
+        bnorm = 1.0
+    history = [float(numpy.sqrt((r*r).sum())/bnorm)]
+    tolflag = criterion == "residual" and history[0] <= tolerance
+    change = float("inf")
+    p = None
+    rz = 0.0
+    iter = 0
+    while not tolflag and iter < maxiter:
+        iter += 1
+        apply(r,z)
+        rzold = rz
+        rz = float((r*z).sum())
+        if p is None:
+            p = z.copy()
+        else:
+            p *= rz/rzold
+            p += z
+        operator(p,q)
+        alpha = rz/float((p*q).sum())
+        x += alpha*p
+        r -= alpha*q
+        history.append(float(numpy.sqrt((r*r).sum())/bnorm))
+        change = alpha**2*float((p*p).sum())
+        if verbose:
+            print("iteration",iter,"residual",history[-1],"change",change)
+        if criterion == "residual":
+            tolflag = history[-1] <= tolerance
+        else:
+            tolflag = change <= tolerance
+    info = {"iterations":iter,"closure":change,"residual":history[-1],"converged":tolflag,"history":history}
+    return(x,info)
+
+def cgsolve(model,precond="ic",criterion="residual",tolerance=None,maxiter=None,verbose=False):
+    """Matrix-free preconditioned conjugate gradients; returns (head, info).
+
+    precond is "ic" (incomplete Cholesky), "jacobi" (diagonal),
+    "multigrid" (one V-cycle of gwmultigrid) or None.
+    criterion "residual" stops on the relative residual ||b - A h||/||b||
+    (tolerance defaults to 1e-10); "change" keeps the script's test, the
+    sum of squared head changes between iterates against model tolerance.
+    info["history"] holds the relative residual of every iteration."""
+    if criterion == "residual" and tolerance is None:
+        tolerance = 1.0e-10
+    elif criterion == "change" and tolerance is None:
+        tolerance = model["tolerance"]
+    elif criterion not in ["residual","change"]:
+        raise ValueError("unknown criterion: " + str(criterion))
+    if maxiter is None:
+        maxiter = model["maxiter"]
+    stencil = closeboundary(buildstencil(model),model)
+    apply = preconditioner(model,stencil,precond)
+    shape = (model["nrows"],model["ncols"])
+    rhs = numpy.zeros(shape)
+    rhs[1:-1,1:-1] = buildrhs(model,stencil)
+    x = numpy.zeros(shape)
+    x[1:-1,1:-1] = numpy.asarray(model["head"],dtype=numpy.float64)[1:-1,1:-1]
+    x,info = pcg(stencil,rhs,x,apply,criterion,tolerance,maxiter,verbose)
+    head = numpy.array(model["head"],dtype=numpy.float64)
+    head[1:-1,1:-1] = x[1:-1,1:-1]
+    applyboundary(head,model)
+    return(head,info)
+
+def mixedsolve(model,solver="cg",precond="ic",tolerance=None,inner=1.0e-4,maxiter=None,maxrefine=10,
+               omega=None,verbose=False):
+    """Mixed-precision solve: float32 iterations inside float64 iterative refinement; returns (head, info).
+
+    Each refinement step takes the float64 residual r = b - A h, solves
+    the correction equation A e = r approximately in single precision
+    (solver "cg": PCG with precond on a float32 copy of the stencil;
+    "sor": red-black SOR sweeps, until the residual stops falling for
+    2*(nrows+ncols) sweeps), down to a relative residual of inner,
+    and adds e to h in float64.  inner should stay above float32
+    round-off (about 1e-6); each step then gains about -log10(inner)
+    digits.  The steps stop when ||b - A h||/||b|| <= tolerance (default
+    1e-10), as in cgsolve, when a step no longer halves the residual
+    (the float64 round-off floor of a large grid), or after maxrefine
+    steps; info["stopped"] says which.  info also holds the inner
+    iterations of each step, the float64 residual history, and
+    "corrections", the largest head change (m) of each step: the last
+    one bounds the error left in the step before it, so it shows the
+    accuracy achieved.  Single precision pays where the inner iteration
+    is memory bound (sor, or cg with precond "jacobi"); the IC(0)
+    wavefront substitutions cost about the same in either precision."""
+    import time
+    if solver not in ["cg","sor"]:
+        raise ValueError("unknown mixed-precision solver: " + str(solver))
+    if tolerance is None:
+        tolerance = 1.0e-10
+    if maxiter is None:
+        maxiter = model["maxiter"]
+    start = time.perf_counter()
+    nrows = model["nrows"]
+    ncols = model["ncols"]
+    stencil = closeboundary(buildstencil(model),model)
+    single = packstencil(stencil,numpy.float32)
+    if solver == "cg":
+        apply = preconditioner(model,single,precond)
+    else:
+        colors = colorslices(nrows,ncols)
+        if omega is None:
+            omega = estimateomega(model,stencil)
+    rhs = numpy.zeros((nrows,ncols))
+    rhs[1:-1,1:-1] = buildrhs(model,stencil)
+    bnorm = numpy.sqrt((rhs*rhs).sum()) or 1.0
+    x = numpy.zeros((nrows,ncols))
+    x[1:-1,1:-1] = numpy.asarray(model["head"],dtype=numpy.float64)[1:-1,1:-1]
+    r = numpy.zeros((nrows,ncols))
+    ax = numpy.zeros((nrows,ncols))
+    # single-precision correction, residual and work array, zero on the ring
+    e = numpy.zeros((nrows,ncols),dtype=numpy.float32)
+    r32 = numpy.zeros((nrows,ncols),dtype=numpy.float32)
+    ae = numpy.zeros((nrows,ncols),dtype=numpy.float32)
+    setup = time.perf_counter() - start
+    history = []
+    corrections = []
+    inneriterations = []
+    refine = 0
+    while True:
+        r[1:-1,1:-1] = rhs[1:-1,1:-1] - applyoperator(x,stencil,ax)[1:-1,1:-1]
+        history.append(float(numpy.sqrt((r*r).sum())/bnorm))
+        if verbose:
+            print("refinement",refine,"residual",history[-1])
+        if history[-1] <= tolerance:
+            stopped = "tolerance"
+            break
+        if refine >= 2 and history[-1] > 0.5*history[-2]:
+            stopped = "stagnated"
+            break
+        if refine >= maxrefine:
+            stopped = "maxrefine"
+            break
+        refine += 1
+        r32[:,:] = r
+        e[:,:] = 0.0
+        if solver == "cg":
+            e,info = pcg(single,r32,e,apply,"residual",inner,maxiter)
+            inneriterations.append(info["iterations"])
+        else:
+            # the sweeps solve A e = r through qrat = -r
+            single["qrat"][1:-1,1:-1] = -r32[1:-1,1:-1]
+            rnorm = numpy.sqrt((r32*r32).sum()) or 1.0
+            best = float("inf")
+            bestiter = 0
+            iter = 0
+            while iter < maxiter:
+                redblacksweep(e,single,colors,omega)
+                iter += 1
+                if iter % 10 == 0:
+                    ae[1:-1,1:-1] = r32[1:-1,1:-1] - applyoperator(e,single,ae)[1:-1,1:-1]
+                    residual = numpy.sqrt((ae*ae).sum())/rnorm
+                    if residual <= inner:
+                        break
+                    if residual < best:
+                        best = residual
+                        bestiter = iter
+                    elif iter - bestiter >= 2*(nrows + ncols):
+                        # float32 round-off floor: leave the rest to the next refinement step
+                        break
+            inneriterations.append(iter)
+        corrections.append(float(numpy.abs(e).max()))
+        x[1:-1,1:-1] += e[1:-1,1:-1]
+    head = numpy.array(model["head"],dtype=numpy.float64)
+    head[1:-1,1:-1] = x[1:-1,1:-1]
+    applyboundary(head,model)
+    info = {"iterations":refine,"inner":inneriterations,"closure":history[-1],"residual":history[-1],
+            "converged":history[-1] <= tolerance,"stopped":stopped,"history":history,"corrections":corrections,"omega":omega,
+            "setup":setup,"solve":time.perf_counter() - start - setup}
+    return(head,info)
+
+def fixedcells(model):
+    """Boolean grid of the fixed-head boundary cells (flag 1 on their side)."""
+    fixed = numpy.zeros((model["nrows"],model["ncols"]),dtype=bool)
+    fixed[0,numpy.asarray(model["boundarytop"]) != 0] = True
+    fixed[-1,numpy.asarray(model["boundarybottom"]) != 0] = True
+    fixed[numpy.asarray(model["boundaryleft"]) != 0,0] = True
+    fixed[numpy.asarray(model["boundaryright"]) != 0,-1] = True
+    return(fixed)
+
+def warmstart(model,start):
+    """Copy of model that starts from a previous head field instead of its input heads.
+
+    start is an array or a head file readhead() understands (.out, .npy,
+    .gwz, raw .f64/.f32).  Fixed-head boundary cells keep the values of
+    model; every other cell is taken from start."""
+    shape = (model["nrows"],model["ncols"])
+    if isinstance(start,str):
+        start = readhead(start,shape=shape)
+    head = numpy.array(start,dtype=numpy.float64)
+    if head.shape != shape:
+        raise ValueError("warm start heads have shape " + str(head.shape) + ", model is " + str(shape))
+    fixed = fixedcells(model)
+    head[fixed] = numpy.asarray(model["head"],dtype=numpy.float64)[fixed]
+    warm = dict(model)
+    warm["head"] = head
+    return(warm)
+
+def sameaquifer(model,other):
+    """True if two models differ at most in pumping and starting heads (same operator and fixed heads)."""
+    for name in ["deltax","deltay","deltaz","nrows","ncols"]:
+        if model[name] != other[name]:
+            return(False)
+    for name in ["boundarytop","boundarybottom","boundaryleft","boundaryright","hydcondx","hydcondy"]:
+        if not numpy.array_equal(numpy.asarray(model[name]),numpy.asarray(other[name])):
+            return(False)
+    # fixed-head boundary cells enter the right-hand side
+    fixed = fixedcells(model)
+    return(bool(numpy.array_equal(numpy.asarray(model["head"])[fixed],numpy.asarray(other["head"])[fixed])))
+
+def batchsolve(model,pumpings,solver="direct",precond="ic",tolerance=None,maxiter=None,verbose=False):
+    """Solve one aquifer for several pumping arrays; returns (heads, info).
+
+    The operator is factored ("direct") or preconditioned ("cg") once and
+    reused for every right-hand side; heads has shape (len(pumpings), nrows, ncols).
+    info holds the one-off "setup" time, the "solve" time for all
+    right-hand sides and, for "cg", the iteration count of each solve."""
+    import time
+    if solver not in ["direct","cg"]:
+        raise ValueError("unknown batch solver: " + str(solver))
+    if tolerance is None:
+        tolerance = 1.0e-10
+    if maxiter is None:
+        maxiter = model["maxiter"]
+    nrows = model["nrows"]
+    ncols = model["ncols"]
+    start = time.perf_counter()
+    stencil = closeboundary(buildstencil(model),model)
+    if solver == "direct":
+        matrix,rhs = assemble(model,stencil)
+        factor = factorize(matrix)
+    else:
+        apply = preconditioner(model,stencil,precond)
+    setup = time.perf_counter() - start
+    start = time.perf_counter()
+    # right-hand sides differ only in -qrat
+    fixedpart = buildrhs(model,stencil) + stencil["qrat"][1:-1,1:-1]
+    rhslist = [fixedpart - numpy.asarray(pumping,dtype=numpy.float64)[1:-1,1:-1]/(model["deltax"]*model["deltay"])/365.0
+               for pumping in pumpings]
+    heads = numpy.empty((len(rhslist),nrows,ncols))
+    heads[:,:,:] = numpy.asarray(model["head"],dtype=numpy.float64)
+    iterations = []
+    if solver == "direct":
+        x = factor.solve(numpy.stack([rhs.ravel() for rhs in rhslist],axis=1))
+        for k in range(len(rhslist)):
+            heads[k,1:-1,1:-1] = x[:,k].reshape(nrows - 2,ncols - 2)
+    else:
+        rhs = numpy.zeros((nrows,ncols))
+        for k in range(len(rhslist)):
+            rhs[1:-1,1:-1] = rhslist[k]
+            x = numpy.zeros((nrows,ncols))
+            x[1:-1,1:-1] = heads[k,1:-1,1:-1]
+            x,cginfo = pcg(stencil,rhs,x,apply,"residual",tolerance,maxiter)
+            heads[k,1:-1,1:-1] = x[1:-1,1:-1]
+            iterations.append(cginfo["iterations"])
+    for k in range(len(rhslist)):
+        applyboundary(heads[k],model)
+    solvetime = time.perf_counter() - start
+    if verbose:
+        print("setup",setup,"s  solve",solvetime,"s for",len(rhslist),"right-hand sides")
+    info = {"setup":setup,"solve":solvetime,"iterations":iterations}
+    return(heads,info)
+
+def activecells(model):
+    """Active-cell mask: interior cells with some conductivity (the ring holds ghost and fixed-head cells)."""
+    active = numpy.zeros((model["nrows"],model["ncols"]),dtype=bool)
+    active[1:-1,1:-1] = (numpy.asarray(model["hydcondx"])[1:-1,1:-1] > 0) | (numpy.asarray(model["hydcondy"])[1:-1,1:-1] > 0)
+    return(active)
+
+def cellgrid(model,order="plan",active=None):
+    """Grid location of every cell ID; an (ncells, 2) integer array of [row, col].
+
+    order "plan" numbers the cells as on the notebook's plan view (the
+    cellloc table): rows fastest, columns from the last interior column
+    back to the first, so on the 7 x 7 example ID 0 is [1, 5] and ID 24
+    is [5, 1].  "row" numbers them row-major, the order of the unknowns
+    in assemble.  Cells outside active (default activecells) get no ID,
+    so IDs stay consecutive."""
+    nrows = model["nrows"]
+    ncols = model["ncols"]
+    if active is None:
+        active = activecells(model)
+    if order == "plan":
+        cols,rows = numpy.meshgrid(numpy.arange(ncols - 2,0,-1),numpy.arange(1,nrows - 1),indexing="ij")
+    elif order == "row":
+        rows,cols = numpy.meshgrid(numpy.arange(1,nrows - 1),numpy.arange(1,ncols - 1),indexing="ij")
+    else:
+        raise ValueError("unknown cell order: " + str(order))
+    rows = rows.ravel()
+    cols = cols.ravel()
+    keep = active[rows,cols]
+    return(numpy.column_stack((rows[keep],cols[keep])))
+
+def cellnumber(model,cells):
+    """Inverse of cellgrid: an (nrows, ncols) array of the cell ID at each location, -1 where there is none."""
+    ids = -numpy.ones((model["nrows"],model["ncols"]),dtype=numpy.int64)
+    cells = numpy.asarray(cells)
+    ids[cells[:,0],cells[:,1]] = numpy.arange(len(cells))
+    return(ids)
+
+def gathercells(fields,cells):
+    """Values of one field (nrows, ncols) or a stack (..., nrows, ncols) at the cells; the cell axis is last."""
+    cells = numpy.asarray(cells)
+    return(numpy.asarray(fields)[...,cells[:,0],cells[:,1]])
+
+def observedcells(model,cells):
+    """Interior cell whose head each of cells reports; (-1, -1) where it is always zero drawdown.
+
+    Interior cells report themselves, no-flow ghost cells the interior
+    cell they copy, and fixed-head cells nothing."""
+    nrows = model["nrows"]
+    ncols = model["ncols"]
+    ids = -numpy.ones((nrows,ncols))
+    ids[1:-1,1:-1] = numpy.arange(nrows*ncols).reshape(nrows,ncols)[1:-1,1:-1]
+    applyboundary(ids,model)
+    observed = []
+    for cell in cells:
+        id = int(ids[cell[0],cell[1]])
+        observed.append(divmod(id,ncols) if id >= 0 else (-1,-1))
+    return(observed)
+
+def influenceplan(model,wells,cells,direction=None):
+    """Unit sources and gathered cells of an influence table; returns (direction, sources, targets).
+
+    "forward" puts a source at each well and gathers at the cells;
+    "adjoint" the other way round.  None picks the direction with fewer
+    solves.  A (-1, -1) source or target stands for zero drawdown."""
+    nrows = model["nrows"]
+    ncols = model["ncols"]
+    if direction is None:
+        direction = "adjoint" if len(cells) < len(wells) else "forward"
+    # pumping on the boundary ring is ignored, as in the script
+    pumped = [(int(well[0]),int(well[1])) if 0 < well[0] < nrows - 1 and 0 < well[1] < ncols - 1 else (-1,-1)
+              for well in wells]
+    if direction == "forward":
+        return(direction,pumped,observedcells(model,cells))
+    elif direction == "adjoint":
+        # a ghost observation cell sees its interior neighbour
+        return(direction,observedcells(model,cells),pumped)
+    raise ValueError("unknown direction: " + str(direction))
+
+def unitoperator(model,rate=1.0e6,solver="direct",precond="ic"):
+    """Operator of the unit-source solves of an influence table, set up once; returns a dict.
+
+    "model" is the aquifer with zero fixed heads, "stencil" its closed
+    stencil, "matrix" the assembled operator, "scale" the source term
+    rate/(deltax*deltay)/365 of one well, and "factor" the sparse LU
+    (solver "direct") or "apply" the CG preconditioner ("cg"); solver
+    None sets up neither."""
+    unit = dict(model)
+    unit["head"] = numpy.zeros((model["nrows"],model["ncols"]))
+    stencil = closeboundary(buildstencil(unit),unit)
+    operator = {"model":unit,"stencil":stencil,"solver":solver,"matrix":assemble(unit,stencil)[0],
+                "scale":rate/(model["deltax"]*model["deltay"])/365.0}
+    if solver == "direct":
+        operator["factor"] = factorize(operator["matrix"])
+    elif solver == "cg":
+        operator["apply"] = preconditioner(unit,stencil,precond)
+    elif solver is not None:
+        raise ValueError("unknown influence solver: " + str(solver))
+    return(operator)
+
+def unitdrawdowns(operator,sources,targets,tolerance=1.0e-10,maxiter=1000):
+    """Drawdown at targets for a unit source at each of sources; a (len(sources), len(targets)) array.
+
+    sources and targets are interior [row, col] cells as from
+    influenceplan, (-1, -1) giving a zero row or column.  The direct
+    solver takes all sources in one multi-column solve, so callers pass
+    a chunk of sources at a time to bound the memory."""
+    unit = operator["model"]
+    nrows = unit["nrows"]
+    ncols = unit["ncols"]
+    targets = numpy.array(targets,dtype=numpy.int64).reshape(-1,2)
+    missing = targets[:,0] < 0
+    # missing targets read cell [1, 1] and are zeroed
+    rows = numpy.where(missing,1,targets[:,0])
+    cols = numpy.where(missing,1,targets[:,1])
+    if operator["solver"] == "direct":
+        rhs = numpy.zeros(((nrows - 2)*(ncols - 2),len(sources)))
+        for k in range(len(sources)):
+            if sources[k][0] >= 0:
+                rhs[(sources[k][0] - 1)*(ncols - 2) + sources[k][1] - 1,k] = -operator["scale"]
+        values = -operator["factor"].solve(rhs)[(rows - 1)*(ncols - 2) + cols - 1,:].T
+    elif operator["solver"] == "cg":
+        values = numpy.zeros((len(sources),len(targets)))
+        for k in range(len(sources)):
+            if sources[k][0] >= 0:
+                rhs = numpy.zeros((nrows,ncols))
+                rhs[sources[k][0],sources[k][1]] = -operator["scale"]
+                head,cginfo = pcg(operator["stencil"],rhs,numpy.zeros((nrows,ncols)),operator["apply"],
+                                  "residual",tolerance,maxiter)
+                values[k,:] = -head[rows,cols]
+    else:
+        raise ValueError("unknown influence solver: " + str(operator["solver"]))
+    values[:,missing] = 0.0
+    return(values)
+
+def influence(model,wells,cells=None,rate=1.0e6,direction=None,solver="direct",precond="ic",
+              tolerance=None,maxiter=None,chunk=32):
+    """Unit drawdown (influence) matrix of the aquifer in model; returns ddn as an array.
+
+    ddn[icell][ip] is the drawdown at cells[icell] caused by pumping rate
+    (m^3/yr, default the notebook's 1 Mm^3/yr) at wells[ip]; wells and
+    cells are lists of [row, col] grid locations, cells defaulting to
+    wells.  The model is linear, so the table comes from solves of the
+    operator with a unit source and zero fixed heads instead of
+    subtracting pumped runs from the base run.  direction "forward"
+    solves once per well (one column each); "adjoint" solves once per
+    observation cell (one row each), which gives the same numbers
+    because the operator is symmetric (reciprocity: drawdown at a for a
+    well at b equals drawdown at b for a well at a).  The default picks
+    whichever needs fewer solves.  The operator is factored (or
+    preconditioned) once for all of them, and the solves run chunk
+    sources at a time with only the targets kept, so no head field is
+    stored per source.  A well on the boundary ring has no effect, as in
+    the script."""
+    if cells is None:
+        cells = wells
+    if tolerance is None:
+        tolerance = 1.0e-10
+    if maxiter is None:
+        maxiter = model["maxiter"]
+    direction,sources,targets = influenceplan(model,wells,cells,direction)
+    operator = unitoperator(model,rate,solver,precond)
+    table = numpy.empty((len(sources),len(targets)))
+    for first in range(0,len(sources),chunk):
+        table[first:first + chunk,:] = unitdrawdowns(operator,sources[first:first + chunk],targets,tolerance,maxiter)
+    if direction == "adjoint":
+        return(table)
+    return(table.T)
+
+def sparseinfluence(model,wells,cells=None,rate=1.0e6,threshold=1.0e-4,direction=None,solver="direct",precond="ic",
+                    tolerance=None,maxiter=None,chunk=32):
+    """Influence matrix without its negligible drawdowns; returns (ddn, info), ddn a scipy.sparse CSR matrix.
+
+    ddn[icell, ip] is the same drawdown as in influence, but coefficients
+    with |ddn| < threshold (m) are not stored.  The dense table is never
+    formed: the unit-source solves run chunk sources at a time and each
+    chunk is truncated as it comes in, so memory goes with the kept
+    entries.  info reports the truncation: the "kept" and "dropped"
+    entry counts, the "density" of the kept table, "maxdropped" the
+    largest dropped |coefficient|, and "rowerror" the largest row sum of
+    dropped |coefficients|, which bounds the drawdown error at any cell
+    per unit of pumping (rate) at every well."""
+    import time
+    import scipy.sparse
+    if cells is None:
+        cells = wells
+    if tolerance is None:
+        tolerance = 1.0e-10
+    if maxiter is None:
+        maxiter = model["maxiter"]
+    start = time.perf_counter()
+    direction,sources,targets = influenceplan(model,wells,cells,direction)
+    operator = unitoperator(model,rate,solver,precond)
+    keptsources = []
+    kepttargets = []
+    keptvalues = []
+    rowerror = numpy.zeros(len(cells))
+    maxdropped = 0.0
+    dropped = 0
+    for first in range(0,len(sources),chunk):
+        block = sources[first:first + chunk]
+        values = unitdrawdowns(operator,block,targets,tolerance,maxiter)
+        small = numpy.abs(values) < threshold
+        lost = numpy.where(small,numpy.abs(values),0.0)
+        dropped += int(numpy.count_nonzero(lost))
+        maxdropped = max(maxdropped,float(lost.max(initial=0.0)))
+        # rows of ddn are the targets (forward) or the sources (adjoint)
+        if direction == "forward":
+            rowerror += lost.sum(axis=0)
+        else:
+            rowerror[first:first + len(block)] = lost.sum(axis=1)
+        keep = numpy.nonzero(~small & (values != 0.0))
+        keptsources.append(keep[0] + first)
+        kepttargets.append(keep[1])
+        keptvalues.append(values[keep])
+    keptsources = numpy.concatenate(keptsources)
+    kepttargets = numpy.concatenate(kepttargets)
+    keptvalues = numpy.concatenate(keptvalues)
+    if direction == "forward":
+        ddn = scipy.sparse.coo_matrix((keptvalues,(kepttargets,keptsources)),shape=(len(cells),len(wells)))
+    else:
+        ddn = scipy.sparse.coo_matrix((keptvalues,(keptsources,kepttargets)),shape=(len(cells),len(wells)))
+    ddn = ddn.tocsr()
+    info = {"direction":direction,"threshold":threshold,"kept":int(ddn.nnz),"dropped":dropped,
+            "density":ddn.nnz/max(1,len(cells)*len(wells)),"maxdropped":maxdropped,
+            "rowerror":float(rowerror.max(initial=0.0)),"seconds":time.perf_counter() - start}
+    return(ddn,info)
+
+def sse(matrix1,matrix2):
+    """Sum of squared differences -- the script's stopping test."""
+    return(float(((matrix1 - matrix2)**2).sum()))
+
+def convergencemeasures(model,criteria):
+    """Set up the stopping measures named in criteria; returns measure(head, headold) -> {name: value}.
+
+    "sse" is the script's sum of squared head changes, "maxchange" the
+    largest absolute head change, "residual" the relative residual
+    ||b - A h||/||b|| of the interior balance, and "massbalance" the net
+    imbalance of the whole grid |sum(b - A h)| over the total pumping and
+    recharge sum|qrat| (all in the stencil's per-area rate units)."""
+    for name in criteria:
+        if name not in CRITERIA:
+            raise ValueError("unknown convergence criterion: " + str(name))
+    if "residual" in criteria or "massbalance" in criteria:
+        closed = closeboundary(buildstencil(model),model)
+        rhs = buildrhs(model,closed)
+        bnorm = numpy.sqrt((rhs*rhs).sum())
+        qtotal = numpy.abs(closed["qrat"][1:-1,1:-1]).sum()
+        if bnorm == 0.0:
+            bnorm = 1.0
+        if qtotal == 0.0:
+            qtotal = numpy.abs(rhs).sum() or 1.0
+        x = numpy.zeros((model["nrows"],model["ncols"]))
+        ax = numpy.zeros((model["nrows"],model["ncols"]))
+    def measure(head,headold):
+        values = {}
+        if "sse" in criteria:
+            values["sse"] = sse(head,headold)
+        if "maxchange" in criteria:
+            values["maxchange"] = float(numpy.abs(head - headold).max())
+        if "residual" in criteria or "massbalance" in criteria:
+            # the closed operator works on the interior with a zero ring
+            x[1:-1,1:-1] = head[1:-1,1:-1]
+            r = rhs - applyoperator(x,closed,ax)[1:-1,1:-1]
+            if "residual" in criteria:
+                values["residual"] = float(numpy.sqrt((r*r).sum())/bnorm)
+            if "massbalance" in criteria:
+                values["massbalance"] = float(abs(r.sum())/qtotal)
+        return(values)
+    return(measure)
+
+def solve(model,solver="jacobi",tolerance=None,maxiter=None,omega=None,
+          precond="ic",criterion=None,cycle="V",start=None,criteria=None,depth=None,tilerows=None,
+          precision="double",inner=1.0e-4,verbose=False):
+    """Solve for the steady head field; returns (head, info).
+
+    solver is "jacobi", "gauss-seidel" (red-black ordering), "sor"
+    (red-black, omega estimated by estimateomega() unless given),
+    "direct" (sparse LU of the assembled system, see directsolve()),
+    "cg" (preconditioned conjugate gradients, see cgsolve()) or
+    "multigrid" (V-cycles or FMG, see gwmultigrid.mgsolve()).
+    start, if given, warm-starts the iterative solvers from a previous
+    head field (array or head file, see warmstart()).
+    criteria sets the stopping tests of the jacobi/gauss-seidel/sor
+    sweeps as {name: tolerance} over CRITERIA (default {"sse": tolerance},
+    the script's test); the sweeps stop as soon as any one is met and
+    info["stopped"] names it ("maxiter" if none was, "stagnated" if the
+    heads stopped changing beyond round-off first, which counts as
+    converged).
+    depth, for gauss-seidel and sor, runs depth sweeps per cache-blocked
+    pass (see tiledsweep(), tiles of tilerows rows); the stopping tests
+    are then checked every depth sweeps, on the change made by the last
+    sweep of the pass, so up to depth-1 extra sweeps may be done.
+    precision "mixed", for cg and sor, iterates in float32 inside float64
+    iterative refinement (see mixedsolve(), inner tolerance inner)."""
+    if start is not None:
+        model = warmstart(model,start)
+    if precision == "mixed":
+        return(mixedsolve(model,solver=solver,precond=precond,tolerance=tolerance,inner=inner,maxiter=maxiter,
+                          omega=omega,verbose=verbose))
+    if precision != "double":
+        raise ValueError("unknown precision: " + str(precision))
+    if solver == "direct":
+        return(directsolve(model,verbose=verbose))
+    if solver == "cg":
+        return(cgsolve(model,precond=precond,criterion=criterion or "residual",
+                       tolerance=tolerance,maxiter=maxiter,verbose=verbose))
+    if solver == "multigrid":
+        import gwmultigrid
+        return(gwmultigrid.mgsolve(model,cycle=cycle,tolerance=tolerance,maxiter=maxiter,verbose=verbose))
+    if tolerance is None:
+        tolerance = model["tolerance"]
+    if maxiter is None:
+        maxiter = model["maxiter"]
+    if solver not in ["jacobi","gauss-seidel","sor"]:
+        raise ValueError("unknown solver: " + str(solver))
+    stencil = buildstencil(model)
+    if solver != "jacobi":
+        stencil = closeboundary(stencil,model)
+    if solver == "gauss-seidel":
+        omega = 1.0
+    elif solver == "sor" and omega is None:
+        omega = estimateomega(model,stencil)
+    if criteria is None:
+        criteria = {"sse":tolerance}
+    measure = convergencemeasures(model,criteria)
+    head = numpy.array(model["head"],dtype=numpy.float64)
+    headold = head.copy()
+    work = numpy.empty_like(head)
+    colors = colorslices(model["nrows"],model["ncols"])
+    percentdiff = float("inf")
+    values = {}
+    stopped = "maxiter"
+    tiled = solver != "jacobi" and depth is not None and depth > 1
+    # round-off stagnation: a tolerance below what float64 resolves (the
+    # input files' sse of 1e-36) is never met once the last bits of the
+    # heads dither, as they do under SOR; stop when the sweeps only change
+    # heads at round-off level and the sse has set no new low for window sweeps
+    window = 2*(model["nrows"] + model["ncols"])
+    best = float("inf")
+    bestiter = 0
+    iter = 0
+    while iter < maxiter:
+        if solver == "jacobi":
+            applyboundary(head,model)
+            jacobisweep(head,stencil,work)
+            iter += 1
+        elif tiled:
+            # the sweep leaves the heads before its last sweep in headold
+            sweeps = min(depth,maxiter - iter)
+            tiledsweep(head,stencil,sweeps,tilerows,omega,headold)
+            iter += sweeps
+        else:
+            redblacksweep(head,stencil,colors,omega)
+            iter += 1
+        values = measure(head,headold)
+        # closure is always the script's sse, whichever tests are configured
+        percentdiff = values["sse"] if "sse" in values else sse(head,headold)
+        if verbose:
+            print("iteration",iter,values)
+        met = [name for name in CRITERIA if name in criteria and values[name] <= criteria[name]]
+        if met:
+            stopped = met[0]
+            break
+        if percentdiff < best:
+            best = percentdiff
+            bestiter = iter
+        elif iter - bestiter >= window:
+            roundoff = 64.0*numpy.finfo(numpy.float64).eps*numpy.abs(head).max()
+            if numpy.abs(head - headold).max() <= roundoff:
+                stopped = "stagnated"
+                break
+        if not tiled:
+            headold[:,:] = head
+    applyboundary(head,model)
+    info = {"iterations":iter,"closure":percentdiff,"converged":stopped != "maxiter","omega":omega,
+            "stopped":stopped,"measures":values}
+    return(head,info)
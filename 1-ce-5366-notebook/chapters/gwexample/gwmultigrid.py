@@ -0,0 +1,210 @@
+# Geometric multigrid for the 2D steady confined groundwater model
+# Companion to gwmodel.py.  The interior cells are coarsened by keeping every
+# other row and column (coarse point I sits on fine point 2I+1).  Prolongation
+# is operator dependent, in the manner of Dendy's black-box multigrid: the
+# interpolation weights come from the level's own stencil, so jumps in
+# hydcondx/hydcondy are followed instead of smeared, and the closed no-flow
+# edges (zero row sum) extrapolate while fixed-head edges decay to zero
+# correction.  Coarse operators are Galerkin products P'AP.
+# On strongly heterogeneous conductivity (lognormal, white noise) plain
+# V-cycles still slow down as the grid grows, so mgsolve uses each cycle as
+# a CG preconditioner by default; the cycle count then grows only slowly.
+import numpy
+import gwmodel
+
+def stencilarrays(matrix,m,n):
+    """Nine-point stencil of a level matrix as an array st[di+1, dj+1, cell]."""
+    coo = matrix.tocoo()
+    di = coo.col//n - coo.row//n
+    dj = coo.col % n - coo.row % n
+    st = numpy.zeros((3,3,m*n))
+    st[di + 1,dj + 1,coo.row] = coo.data
+    return(st)
+
+def prolongation(matrix,m,n):
+    """Operator-dependent prolongation from the (m//2, n//2) coarse grid to the (m, n) fine grid."""
+    import scipy.sparse
+    mc = m//2
+    nc = n//2
+    st = stencilarrays(matrix,m,n)
+    i,j = numpy.divmod(numpy.arange(m*n),n)
+    rows = []
+    cols = []
+    vals = []
+    def add(mask,ci,cj,w):
+        keep = mask & (ci >= 0) & (ci < mc) & (cj >= 0) & (cj < nc) & (w != 0.0)
+        rows.append(numpy.flatnonzero(keep))
+        cols.append((ci*nc + cj)[keep])
+        vals.append(w[keep])
+    oddi = i % 2 == 1
+    oddj = j % 2 == 1
+    # coarse points
+    add(oddi & oddj,(i - 1)//2,(j - 1)//2,numpy.ones(m*n))
+    # on a coarse row, between coarse columns: collapse the stencil vertically
+    denom = st[1,1] + st[0,1] + st[2,1]
+    denom[denom == 0.0] = 1.0
+    add(oddi & ~oddj,(i - 1)//2,j//2 - 1,-(st[0,0] + st[1,0] + st[2,0])/denom)
+    add(oddi & ~oddj,(i - 1)//2,j//2,-(st[0,2] + st[1,2] + st[2,2])/denom)
+    # on a coarse column, between coarse rows: collapse the stencil horizontally
+    denom = st[1,1] + st[1,0] + st[1,2]
+    denom[denom == 0.0] = 1.0
+    add(~oddi & oddj,i//2 - 1,(j - 1)//2,-(st[0,0] + st[0,1] + st[0,2])/denom)
+    add(~oddi & oddj,i//2,(j - 1)//2,-(st[2,0] + st[2,1] + st[2,2])/denom)
+    partial = scipy.sparse.csr_matrix((numpy.concatenate(vals),(numpy.concatenate(rows),numpy.concatenate(cols))),
+                                      shape=(m*n,mc*nc))
+    # cell centres: every neighbour is interpolated already, so solve the local balance
+    centre = (~oddi & ~oddj).astype(numpy.float64)
+    offdiag = matrix - scipy.sparse.diags(matrix.diagonal())
+    local = scipy.sparse.diags(-centre/matrix.diagonal()) @ offdiag
+    return((partial + local @ partial).tocsr())
+
+def colorsets(matrix,m,n):
+    """Four-colour (i%2, j%2) split of a level for Gauss-Seidel smoothing.
+
+    Cells of one colour are two apart, so they do not couple even in the
+    nine-point Galerkin stencils, and each colour is updated at once from
+    its own rows of the matrix."""
+    i,j = numpy.divmod(numpy.arange(m*n),n)
+    diag = matrix.diagonal()
+    colors = []
+    for color in range(4):
+        idx = numpy.flatnonzero((i % 2)*2 + (j % 2) == color)
+        colors.append((idx,matrix[idx,:].tocsr(),1.0/diag[idx]))
+    return(colors)
+
+def smooth(level,rhs,x,reverse=False):
+    """One four-colour Gauss-Seidel sweep, in reverse colour order for post-smoothing."""
+    colors = level["colors"][::-1] if reverse else level["colors"]
+    for idx,rows,invdiag in colors:
+        x[idx] += invdiag*(rhs[idx] - rows @ x)
+    return(x)
+
+def buildhierarchy(model,matrix=None,coarsest=400):
+    """Galerkin multigrid hierarchy for the assembled five-point system.
+
+    Levels are coarsened until the grid has at most coarsest unknowns or a
+    side shorter than three cells; the coarsest level is factored directly."""
+    if matrix is None:
+        matrix,rhs = gwmodel.assemble(model)
+    m = model["nrows"] - 2
+    n = model["ncols"] - 2
+    levels = []
+    while True:
+        matrix = matrix.tocsr()
+        level = {"matrix":matrix,"shape":(m,n)}
+        levels.append(level)
+        if m*n <= coarsest or m < 3 or n < 3:
+            break
+        level["colors"] = colorsets(matrix,m,n)
+        P = prolongation(matrix,m,n)
+        level["prolong"] = P
+        level["restrict"] = P.T.tocsr()
+        matrix = level["restrict"] @ matrix @ P
+        m = m//2
+        n = n//2
+    levels[-1]["factor"] = gwmodel.factorize(levels[-1]["matrix"])
+    return(levels)
+
+def vcycle(levels,rhs,x=None,ilevel=0,nu1=1,nu2=1):
+    """One V(nu1,nu2) cycle with four-colour Gauss-Seidel smoothing; returns the improved x.
+
+    With x None (zero start) and nu1 == nu2 the cycle is a symmetric
+    operator, which is what CG needs from a preconditioner."""
+    level = levels[ilevel]
+    if "factor" in level:
+        return(level["factor"].solve(rhs))
+    if x is None:
+        x = numpy.zeros(rhs.size)
+    for sweep in range(nu1):
+        smooth(level,rhs,x)
+    coarse = level["restrict"] @ (rhs - level["matrix"] @ x)
+    x += level["prolong"] @ vcycle(levels,coarse,None,ilevel + 1,nu1,nu2)
+    for sweep in range(nu2):
+        smooth(level,rhs,x,reverse=True)
+    return(x)
+
+def fmg(levels,rhs,nu1=1,nu2=1):
+    """Full multigrid: solve on the coarsest grid, then interpolate and V-cycle up each level."""
+    rhslist = [rhs]
+    for level in levels[:-1]:
+        rhslist.append(level["restrict"] @ rhslist[-1])
+    x = levels[-1]["factor"].solve(rhslist[-1])
+    for ilevel in range(len(levels) - 2,-1,-1):
+        x = levels[ilevel]["prolong"] @ x
+        x = vcycle(levels,rhslist[ilevel],x,ilevel,nu1,nu2)
+    return(x)
+
+def mgsolve(model,cycle="V",tolerance=None,maxiter=None,nu1=2,nu2=2,accelerate=True,window=5,verbose=False):
+    """Multigrid solve of the steady head field; returns (head, info).
+
+    cycle "V" iterates V-cycles from the input heads, "FMG" starts from a
+    full-multigrid pass and continues with V-cycles.  With accelerate
+    (the default) each cycle is the preconditioner of a conjugate
+    gradient step instead of a plain correction.  Plain cycles converge
+    at a rate independent of the grid only for mild conductivity fields:
+    on a lognormal field with sigma 2 (natural log, white noise) they
+    take 26 cycles at 34 x 34 but 133 at 514 x 514, where the CG-accelerated
+    cycles take 11 and 26 (gwbench.py --multigrid).  Stops when the relative residual
+    ||b - A h||/||b|| reaches tolerance (default 1e-10), or when it has
+    set no new low for window cycles after getting within round-off
+    (1e3 eps) of zero ("stagnated"); a residual that rises for a few
+    cycles before it falls is never taken for stagnation."""
+    import time
+    if tolerance is None:
+        tolerance = 1.0e-10
+    if maxiter is None:
+        maxiter = model["maxiter"]
+    if cycle not in ["V","FMG"]:
+        raise ValueError("unknown cycle: " + str(cycle))
+    start = time.perf_counter()
+    matrix,rhs = gwmodel.assemble(model)
+    levels = buildhierarchy(model,matrix)
+    setup = time.perf_counter() - start
+    bnorm = numpy.linalg.norm(rhs)
+    if bnorm == 0.0:
+        bnorm = 1.0
+    if cycle == "FMG":
+        x = fmg(levels,rhs,nu1,nu2)
+    else:
+        x = numpy.asarray(model["head"],dtype=numpy.float64)[1:-1,1:-1].ravel().copy()
+    r = rhs - matrix @ x
+    history = [float(numpy.linalg.norm(r)/bnorm)]
+    floor = 1.0e3*numpy.finfo(numpy.float64).eps
+    best = history[0]
+    bestiter = 0
+    p = None
+    iter = 0
+    stagnated = False
+    while history[-1] > tolerance and iter < maxiter:
+        iter += 1
+        if accelerate:
+            # a zero-start cycle with nu1 == nu2 is symmetric, as CG needs
+            z = vcycle(levels,r,None,0,nu1,nu2)
+            rz = r @ z
+            p = z if p is None else z + (rz/rzold)*p
+            rzold = rz
+            q = matrix @ p
+            alpha = rz/(p @ q)
+            x += alpha*p
+            r -= alpha*q
+            # the recursive residual drifts from the true one at round-off; report the true one
+            history.append(float(numpy.linalg.norm(rhs - matrix @ x)/bnorm))
+        else:
+            x = vcycle(levels,rhs,x,0,nu1,nu2)
+            r = rhs - matrix @ x
+            history.append(float(numpy.linalg.norm(r)/bnorm))
+        if verbose:
+            print("cycle",iter,"residual",history[-1])
+        if history[-1] < best:
+            best = history[-1]
+            bestiter = iter
+        elif iter - bestiter >= window and best <= floor:
+            stagnated = True
+            break
+    head = numpy.array(model["head"],dtype=numpy.float64)
+    head[1:-1,1:-1] = x.reshape(model["nrows"] - 2,model["ncols"] - 2)
+    gwmodel.applyboundary(head,model)
+    info = {"iterations":iter,"closure":history[-1],"residual":history[-1],
+            "converged":history[-1] <= tolerance or stagnated,"history":history,"levels":len(levels),
+            "setup":setup,"stagnated":stagnated}
+    return(head,info)
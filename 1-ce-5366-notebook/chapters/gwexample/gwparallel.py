@@ -0,0 +1,83 @@
+# Parallel influence-matrix runs for the 2D steady confined groundwater model
+# Companion to gwmodel.py.  The unit-source solves of the influence matrix
+# (one per well, or one per observation cell in the adjoint direction) are
+# independent, so they are spread over a process pool.  Each worker sets up
+# the operator once when it starts (sparse LU factor, or CG preconditioner)
+# and then solves one source per task; results come back in the order of
+# the source list, so column ip of ddn is always wells[ip] (cellloc order in
+# the notebook) whatever order the tasks finish in.
+# Given the name of a binary model directory (gwconvert.py) instead of a
+# model dict, the workers open it themselves with memory maps, so every
+# process shares the one page-cache copy of the arrays instead of getting
+# its own pickled copy.
+import os
+import time
+import numpy
+import gwmodel
+
+# operator, factor and settings of this worker process, set by startworker
+worker = {}
+
+def startworker(model,targets,rate,solver,precond,tolerance,maxiter):
+    """Pool initializer: set up the operator of the zero-fixed-head model once per process.
+
+    model is a model dict or the name of a model file or directory, which
+    is read here (memory-mapped for a binary directory)."""
+    if isinstance(model,str):
+        model = gwmodel.readmodel(model)
+    worker.clear()
+    worker.update({"operator":gwmodel.unitoperator(model,rate,solver,precond),"targets":targets,
+                   "tolerance":tolerance,"maxiter":maxiter})
+
+def sourcetask(source):
+    """Drawdown at the targets for one unit source; returns (ddn column or row, seconds, process id)."""
+    start = time.perf_counter()
+    values = gwmodel.unitdrawdowns(worker["operator"],[source],worker["targets"],
+                                   worker["tolerance"],worker["maxiter"])[0]
+    return(values,time.perf_counter() - start,os.getpid())
+
+def influence(model,wells,cells=None,rate=1.0e6,workers=None,direction=None,solver="direct",precond="ic",
+              tolerance=None,maxiter=None,chunksize=None):
+    """Unit drawdown matrix from a process pool; returns (ddn, info).
+
+    Same ddn as gwmodel.influence: ddn[icell][ip] is the drawdown at
+    cells[icell] for rate at wells[ip], and direction picks forward
+    (a task per well) or adjoint (a task per cell) solves in the same
+    way.  workers is the pool size (default os.cpu_count(), never more
+    than the number of tasks).  info holds the direction, the pool size,
+    the wall-clock time, and one entry per source in "tasks" with its
+    solve time and worker process id.  model may also be the name of a
+    model file or binary model directory; the workers then read it
+    themselves (a directory memory-mapped) instead of being sent its
+    arrays."""
+    import multiprocessing
+    source = model
+    if isinstance(model,str):
+        model = gwmodel.readmodel(model)
+    if cells is None:
+        cells = wells
+    if tolerance is None:
+        tolerance = 1.0e-10
+    if maxiter is None:
+        maxiter = model["maxiter"]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    direction,sources,targets = gwmodel.influenceplan(model,wells,cells,direction)
+    workers = max(1,min(workers,len(sources)))
+    if chunksize is None:
+        chunksize = max(1,len(sources)//(4*workers))
+    start = time.perf_counter()
+    with multiprocessing.Pool(workers,initializer=startworker,
+                              initargs=(source,targets,rate,solver,precond,tolerance,maxiter)) as pool:
+        # map keeps the order of the sources
+        results = pool.map(sourcetask,sources,chunksize)
+    wall = time.perf_counter() - start
+    table = numpy.empty((len(sources),len(targets)))
+    tasks = []
+    for k in range(len(sources)):
+        values,seconds,pid = results[k]
+        table[k,:] = values
+        tasks.append({"source":sources[k],"time":seconds,"worker":pid})
+    ddn = table if direction == "adjoint" else table.T
+    info = {"direction":direction,"workers":workers,"wall":wall,"tasks":tasks}
+    return(ddn,info)
@@ -0,0 +1,132 @@
+# Transient confined flow for the 2D groundwater model
+# Companion to gwmodel.py.  With storativity S the cell balance of the
+# steady model becomes S dh/dt = b - A h, where A h = b is the closed
+# five-point system of gwmodel.assemble and time is in days (conductivity
+# in m/day, pumping in m^3/yr divided by 365 as in the script).  Steps use
+# the theta method
+#     (S/dt + theta A) h[n+1] = (S/dt - (1-theta) A) h[n] + theta b[n+1] + (1-theta) b[n]
+# with theta = 1 for backward Euler and 1/2 for Crank-Nicolson.  The step
+# matrix does not change with time, so it is factored (or preconditioned)
+# once; each step is one back-substitution or one warm-started CG solve.
+import time
+import numpy
+import gwmodel
+
+SCHEMES = {"BE":1.0,"CN":0.5}
+
+def stepstencil(model,storage,dt,theta):
+    """Closed stencil of the step matrix S/dt + theta A, with S/dt held as the "storage" diagonal."""
+    stencil = gwmodel.closeboundary(gwmodel.buildstencil(model),model)
+    step = {}
+    for name in ["amat","bmat","cmat","dmat"]:
+        step[name] = theta*stencil[name]
+    step["qrat"] = stencil["qrat"]
+    shift = numpy.zeros_like(stencil["amat"])
+    shift[1:-1,1:-1] = (numpy.broadcast_to(numpy.asarray(storage,dtype=numpy.float64),shift.shape)/dt)[1:-1,1:-1]
+    step["storage"] = shift
+    return(stencil,gwmodel.packstencil(step))
+
+def timesteps(model,storage,dt,nsteps,scheme="BE",pumping=None,solver="direct",precond="ic",
+              tolerance=None,maxiter=None,info=None):
+    """Generator over the time steps; yields (step, time, head) after every step.
+
+    storage is the storativity, a scalar or an (nrows, ncols) array; dt is
+    the step length in days.  The run starts from model["head"] at time 0.
+    pumping is None for the model's constant pumping, or a function of
+    time (days) returning an (nrows, ncols) pumping array, e.g. a
+    seasonal schedule.  The head array yielded is reused at the next
+    step, so copy it to keep it.  Pass a dict as info to collect the
+    setup time, the total solve time and the CG iteration counts."""
+    if scheme not in SCHEMES:
+        raise ValueError("unknown time-stepping scheme: " + str(scheme))
+    theta = SCHEMES[scheme]
+    if tolerance is None:
+        tolerance = 1.0e-10
+    if maxiter is None:
+        maxiter = model["maxiter"]
+    if info is None:
+        info = {}
+    nrows = model["nrows"]
+    ncols = model["ncols"]
+    start = time.perf_counter()
+    stencil,step = stepstencil(model,storage,dt,theta)
+    if solver == "direct":
+        matrix,rhs = gwmodel.assemble(model,step)
+        factor = gwmodel.factorize(matrix)
+    elif solver == "cg":
+        apply = gwmodel.preconditioner(model,step,precond)
+    else:
+        raise ValueError("unknown transient solver: " + str(solver))
+    # fixed-head part of b; the pumping part is -qrat at each time
+    fixedpart = gwmodel.buildrhs(model,stencil) + stencil["qrat"][1:-1,1:-1]
+    scale = 1.0/(model["deltax"]*model["deltay"])/365.0
+    def balance(t):
+        if pumping is None:
+            return(fixedpart - stencil["qrat"][1:-1,1:-1])
+        return(fixedpart - numpy.asarray(pumping(t),dtype=numpy.float64)[1:-1,1:-1]*scale)
+    info.update({"setup":time.perf_counter() - start,"solve":0.0,"iterations":[]})
+    head = numpy.array(model["head"],dtype=numpy.float64)
+    x = numpy.zeros((nrows,ncols))
+    x[1:-1,1:-1] = head[1:-1,1:-1]
+    ax = numpy.zeros((nrows,ncols))
+    rhs = numpy.zeros((nrows,ncols))
+    bold = balance(0.0)
+    for n in range(nsteps):
+        start = time.perf_counter()
+        bnew = balance((n + 1)*dt)
+        rhs[1:-1,1:-1] = step["storage"][1:-1,1:-1]*x[1:-1,1:-1] + theta*bnew
+        if theta < 1.0:
+            rhs[1:-1,1:-1] += (1.0 - theta)*(bold - gwmodel.applyoperator(x,stencil,ax)[1:-1,1:-1])
+        if solver == "direct":
+            x[1:-1,1:-1] = factor.solve(rhs[1:-1,1:-1].ravel()).reshape(nrows - 2,ncols - 2)
+        else:
+            # the previous step is the starting guess
+            x,cginfo = gwmodel.pcg(step,rhs,x,apply,"residual",tolerance,maxiter)
+            info["iterations"].append(cginfo["iterations"])
+        bold = bnew
+        head[1:-1,1:-1] = x[1:-1,1:-1]
+        gwmodel.applyboundary(head,model)
+        info["solve"] += time.perf_counter() - start
+        yield(n + 1,(n + 1)*dt,head)
+
+def runtransient(model,storage,dt,nsteps,outfile=None,format="npy",every=1,scheme="BE",pumping=None,
+                 solver="direct",precond="ic",tolerance=None,maxiter=None,verbose=False):
+    """Run timesteps() and stream every every-th head field to outfile; returns (last head, info).
+
+    format "npy" writes one (nsaved, nrows, ncols) .npy array, "f64" and
+    "f32" the same values as raw binary, and "text" the script's .out
+    layout once per saved step with "time = t" as the label line.  Each
+    field is written as soon as its step is done; only the current step
+    is held in memory.  info["times"] lists the saved times (days)."""
+    if format not in ["npy","f64","f32","text"]:
+        raise ValueError("unknown transient output format: " + str(format))
+    nsaved = nsteps//every
+    localfile = None
+    if outfile is not None:
+        localfile = open(outfile,"w" if format == "text" else "wb")
+        if format == "npy":
+            numpy.lib.format.write_array_header_1_0(localfile,{"descr":"<f8","fortran_order":False,
+                                                               "shape":(nsaved,model["nrows"],model["ncols"])})
+    dtype = "<f4" if format == "f32" else "<f8"
+    info = {}
+    times = []
+    head = numpy.array(model["head"],dtype=numpy.float64)
+    for n,t,head in timesteps(model,storage,dt,nsteps,scheme,pumping,solver,precond,tolerance,maxiter,info):
+        if n % every != 0:
+            continue
+        times.append(t)
+        if verbose:
+            print("step",n,"time",t,"minimum head",head.min())
+        if localfile is None:
+            continue
+        if format == "text":
+            localfile.writelines("time = " + str(t) + '\n')
+            for row in range(len(head)):
+                localfile.write(" ".join(map(str,head[row]))+"\n")
+        else:
+            localfile.write(numpy.ascontiguousarray(head,dtype=dtype).tobytes())
+    if localfile is not None:
+        localfile.close()
+    info["times"] = times
+    info["steps"] = nsteps
+    return(head.copy(),info)
@@ -0,0 +1,177 @@
+# Unconfined (water-table) flow for the 2D groundwater model
+# Companion to gwmodel.py.  In an unconfined aquifer the transmissivity is
+# conductivity times saturated thickness, b = head - bottom, so the
+# coefficients amat..dmat depend on the heads being solved for.  The
+# face coefficients average the two cells' K*b exactly as the confined
+# stencil averages K (deltaz is replaced by the saturated thickness):
+#     amat[i,j] = (Kx[i-1,j]*b[i-1,j] + Kx[i,j]*b[i,j])/(2 deltax^2)
+# and so on.  Two nonlinear iterations are offered:
+#   picard  -- freeze T at the current heads, solve the linear (SPD)
+#              system, repeat; direct or CG linear solves
+#   newton  -- solve J dh = -F with the exact Jacobian of the cell
+#              balances F (nonsymmetric, sparse LU)
+# Both take the step (Picard: new heads minus old) with backtracking,
+# halving it until the balance residual decreases, which damps the
+# overshoot of plain Picard when T changes a lot with the heads.  Picard
+# still converges only linearly, slowly where the water table is near the
+# base next to a fixed head; Newton is the default in the script.
+# The stencil arrays, the sparse matrix and its index pattern are built
+# once and refilled in place at every nonlinear iteration.
+import numpy
+import gwmodel
+
+def thickness(head,bottom,minthickness):
+    """Saturated thickness head - bottom, kept at least minthickness (dry cells stay weakly conductive)."""
+    return(numpy.maximum(head - bottom,minthickness))
+
+def updatestencil(stencil,model,head,bottom,minthickness,closed):
+    """Refill amat..dmat in place with the unconfined transmissivities at head, closed off like closeboundary."""
+    b = thickness(head,bottom,minthickness)
+    tx = numpy.asarray(model["hydcondx"],dtype=numpy.float64)*b
+    ty = numpy.asarray(model["hydcondy"],dtype=numpy.float64)*b
+    deltax = model["deltax"]
+    deltay = model["deltay"]
+    stencil["amat"][1:-1,1:-1] = (tx[:-2,1:-1] + tx[1:-1,1:-1])/(2.0*deltax**2)
+    stencil["bmat"][1:-1,1:-1] = (tx[1:-1,1:-1] + tx[2:,1:-1])/(2.0*deltax**2)
+    stencil["cmat"][1:-1,1:-1] = (ty[1:-1,:-2] + ty[1:-1,1:-1])/(2.0*deltay**2)
+    stencil["dmat"][1:-1,1:-1] = (ty[1:-1,1:-1] + ty[1:-1,2:])/(2.0*deltay**2)
+    for name in ["amat","bmat","cmat","dmat"]:
+        stencil[name][closed[name]] = 0.0
+    return(gwmodel.updatediagonal(stencil))
+
+def closedmasks(model):
+    """Where closeboundary zeroes each of amat..dmat, as boolean grids."""
+    ones = {}
+    for name in ["amat","bmat","cmat","dmat"]:
+        ones[name] = numpy.ones((model["nrows"],model["ncols"]))
+    closed = gwmodel.closeboundary(ones,model)
+    return({name:closed[name] == 0.0 for name in ones})
+
+def sparsepattern(m,n):
+    """Five-point CSR matrix of the (m, n) interior with a map from COO value order to its data array.
+
+    Values are listed as [diagonal, north, south, west, east] like
+    gwmodel.assemble; matrix.data[:] = values[order] refills it."""
+    import scipy.sparse
+    idx = numpy.arange(m*n).reshape(m,n)
+    rows = numpy.concatenate([idx.ravel(),idx[1:,:].ravel(),idx[:-1,:].ravel(),idx[:,1:].ravel(),idx[:,:-1].ravel()])
+    cols = numpy.concatenate([idx.ravel(),idx[:-1,:].ravel(),idx[1:,:].ravel(),idx[:,:-1].ravel(),idx[:,1:].ravel()])
+    matrix = scipy.sparse.csr_matrix((numpy.arange(rows.size,dtype=numpy.float64),(rows,cols)),shape=(m*n,m*n))
+    order = matrix.data.astype(numpy.int64)
+    return(matrix,order)
+
+def balance(head,stencil,model,out):
+    """Cell balances F = sum of face flows into each interior cell minus qrat; (m, n) array."""
+    h = head[1:-1,1:-1]
+    out[:,:] = (stencil["amat"][1:-1,1:-1]*(head[:-2,1:-1] - h) + stencil["bmat"][1:-1,1:-1]*(head[2:,1:-1] - h)
+                + stencil["cmat"][1:-1,1:-1]*(head[1:-1,:-2] - h) + stencil["dmat"][1:-1,1:-1]*(head[1:-1,2:] - h)
+                - stencil["qrat"][1:-1,1:-1])
+    return(out)
+
+def jacobianvalues(head,stencil,model,closed,bottom,minthickness):
+    """Jacobian dF/dh of balance() in sparsepattern value order [diagonal, north, south, west, east]."""
+    h = head[1:-1,1:-1]
+    wet = (head - bottom > minthickness).astype(numpy.float64)
+    # derivative of one cell's half of a face coefficient with respect to its head
+    kx = numpy.asarray(model["hydcondx"],dtype=numpy.float64)*wet/(2.0*model["deltax"]**2)
+    ky = numpy.asarray(model["hydcondy"],dtype=numpy.float64)*wet/(2.0*model["deltay"]**2)
+    faces = [("amat",head[:-2,1:-1],kx,kx[:-2,1:-1]),("bmat",head[2:,1:-1],kx,kx[2:,1:-1]),
+             ("cmat",head[1:-1,:-2],ky,ky[1:-1,:-2]),("dmat",head[1:-1,2:],ky,ky[1:-1,2:])]
+    diag = numpy.zeros(h.shape)
+    off = []
+    for name,neighbour,k,kneighbour in faces:
+        coupled = ~closed[name][1:-1,1:-1]
+        g = stencil[name][1:-1,1:-1]
+        diff = neighbour - h
+        diag += -g + coupled*k[1:-1,1:-1]*diff
+        off.append(g + coupled*kneighbour*diff)
+    north,south,west,east = off
+    return(numpy.concatenate([diag.ravel(),north[1:,:].ravel(),south[:-1,:].ravel(),
+                              west[:,1:].ravel(),east[:,:-1].ravel()]))
+
+def solve(model,bottom,method="picard",solver="direct",precond="ic",tolerance=1.0e-8,maxiter=50,
+          minthickness=1.0e-3,verbose=False):
+    """Unconfined steady heads; returns (head, info).
+
+    bottom is the aquifer base elevation (scalar or (nrows, ncols) array,
+    same datum as the heads); deltaz of the model is not used.  The
+    iteration starts from model["head"] and stops when the largest head
+    change is at most tolerance (m).  method "picard" uses solver
+    "direct" or "cg" for the linear systems, "newton" a sparse LU of the
+    Jacobian.  info holds the nonlinear iterations, the linear
+    (CG) iterations, the final relative balance residual, whether the
+    tolerance was met ("converged"; False when maxiter ran out) and the
+    history of head changes."""
+    import scipy.sparse.linalg
+    if method not in ["picard","newton"]:
+        raise ValueError("unknown nonlinear method: " + str(method))
+    if solver not in ["direct","cg"]:
+        raise ValueError("unknown linear solver: " + str(solver))
+    nrows = model["nrows"]
+    ncols = model["ncols"]
+    m = nrows - 2
+    n = ncols - 2
+    bottom = numpy.broadcast_to(numpy.asarray(bottom,dtype=numpy.float64),(nrows,ncols))
+    # workspace, allocated once
+    stencil = gwmodel.buildstencil(model)
+    closed = closedmasks(model)
+    matrix,order = sparsepattern(m,n)
+    head = numpy.array(model["head"],dtype=numpy.float64)
+    gwmodel.applyboundary(head,model)
+    # buildrhs reads the fixed heads from here; head is only updated in place
+    current = dict(model)
+    current["head"] = head
+    f = numpy.zeros((m,n))
+    x = numpy.zeros((nrows,ncols))
+    rhs = numpy.zeros((nrows,ncols))
+    qnorm = numpy.sqrt((stencil["qrat"][1:-1,1:-1]**2).sum()) or 1.0
+    history = []
+    linear = 0
+    iter = 0
+    while iter < maxiter:
+        iter += 1
+        updatestencil(stencil,model,head,bottom,minthickness,closed)
+        fnorm = numpy.sqrt((balance(head,stencil,model,f)**2).sum())
+        if method == "picard":
+            if solver == "direct":
+                a = stencil["amat"][1:-1,1:-1]
+                b = stencil["bmat"][1:-1,1:-1]
+                c = stencil["cmat"][1:-1,1:-1]
+                d = stencil["dmat"][1:-1,1:-1]
+                values = numpy.concatenate([stencil["diag"][1:-1,1:-1].ravel(),-a[1:,:].ravel(),-b[:-1,:].ravel(),
+                                            -c[:,1:].ravel(),-d[:,:-1].ravel()])
+                matrix.data[:] = values[order]
+                new = gwmodel.factorize(matrix).solve(gwmodel.buildrhs(current,stencil).ravel())
+                new = new.reshape(m,n)
+            else:
+                rhs[1:-1,1:-1] = gwmodel.buildrhs(current,stencil)
+                x[1:-1,1:-1] = head[1:-1,1:-1]
+                apply = gwmodel.preconditioner(model,stencil,precond)
+                x,info = gwmodel.pcg(stencil,rhs,x,apply,"residual",1.0e-3*tolerance,model["maxiter"])
+                linear += info["iterations"]
+                new = x[1:-1,1:-1]
+            step = new - head[1:-1,1:-1]
+        else:
+            matrix.data[:] = jacobianvalues(head,stencil,model,closed,bottom,minthickness)[order]
+            step = scipy.sparse.linalg.spsolve(matrix.tocsc(),-f.ravel()).reshape(m,n)
+        # backtrack until the balance residual decreases
+        old = head[1:-1,1:-1].copy()
+        scale = 1.0
+        while True:
+            head[1:-1,1:-1] = old + scale*step
+            gwmodel.applyboundary(head,model)
+            updatestencil(stencil,model,head,bottom,minthickness,closed)
+            if numpy.sqrt((balance(head,stencil,model,f)**2).sum()) < fnorm or scale < 1.0e-3:
+                break
+            scale *= 0.5
+        change = numpy.abs(scale*step).max()
+        history.append(float(change))
+        if verbose:
+            print("iteration",iter,"max head change",change,"step",scale)
+        if change <= tolerance:
+            break
+    updatestencil(stencil,model,head,bottom,minthickness,closed)
+    residual = float(numpy.sqrt((balance(head,stencil,model,f)**2).sum())/qnorm)
+    info = {"iterations":iter,"linear":linear,"residual":residual,"converged":history[-1] <= tolerance,
+            "history":history}
+    return(head,info)
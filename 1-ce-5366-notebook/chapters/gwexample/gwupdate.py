@@ -0,0 +1,107 @@
+# Incremental influence-matrix updates for the 2D groundwater model
+# Companion to gwmodel.py.  The influence table is ddn = scale*G[cells,wells]
+# with G the inverse of the closed five-point matrix A (unit-source solves
+# with zero fixed heads, as in gwmodel.influence).  Changing hydcondx or
+# hydcondy in a zone only changes the rows and columns of A belonging to
+# the zone cells and their neighbours, a set S of |S| cells:
+#     A' = A + U C U'      U = the columns of the identity at S,
+#                          C = (A' - A)[S, S]
+# and by the Sherman-Morrison-Woodbury identity
+#     G' = G - (G U) (I + C U'G U)^-1 C (U'G)
+# G U takes |S| back-substitutions with the factor of A, which is kept;
+# U'G is its transpose because A is symmetric.  A one-cell change costs
+# |S| = 5 solves; a full rebuild costs a factorization plus a solve per
+# well.  Changes accumulate against the original factor, so S is
+# every cell changed since it was made; once it holds more cells than
+# there are wells, a rebuild (new factor) is cheaper and is done instead.
+import time
+import numpy
+import gwmodel
+
+def unitmatrix(model):
+    """Assembled matrix of the model with zero fixed heads (the operator of the unit-source solves)."""
+    return(gwmodel.unitoperator(model,solver=None)["matrix"].tocsr())
+
+def interiorindex(model,cells):
+    """Interior unknown number (row-major, as in gwmodel.assemble) of each cell; -1 for (-1, -1)."""
+    n = model["ncols"] - 2
+    return(numpy.array([(cell[0] - 1)*n + cell[1] - 1 if cell[0] >= 0 else -1 for cell in cells],dtype=numpy.int64))
+
+def unitsolves(factor,size,columns):
+    """G[:, columns] by back-substitution, an (size, len(columns)) array."""
+    rhs = numpy.zeros((size,len(columns)))
+    rhs[columns,numpy.arange(len(columns))] = 1.0
+    return(factor.solve(rhs))
+
+def influencestate(model,wells,cells=None,rate=1.0e6):
+    """Factor the aquifer once and build its influence table; returns a state dict for updateinfluence().
+
+    wells, cells and rate are as in gwmodel.influence and state["ddn"] is
+    the same table (forward direction)."""
+    if cells is None:
+        cells = wells
+    start = time.perf_counter()
+    direction,sources,targets = gwmodel.influenceplan(model,wells,cells,"forward")
+    state = {"wells":wells,"cells":cells,"rate":rate,
+             "sources":interiorindex(model,sources),"targets":interiorindex(model,targets)}
+    rebuild(state,model)
+    state["info"] = {"rank":0,"solves":len(wells),"rebuilt":True,"seconds":time.perf_counter() - start}
+    return(state)
+
+def rebuild(state,model):
+    """New base factorization and table for model; resets the accumulated change set."""
+    operator = gwmodel.unitoperator(model,state["rate"])
+    matrix = operator["matrix"].tocsr()
+    factor = operator["factor"]
+    state["scale"] = operator["scale"]
+    sources = state["sources"]
+    targets = state["targets"]
+    # ring wells and unobserved cells read row/column 0 and are zeroed in table()
+    green = unitsolves(factor,matrix.shape[0],numpy.maximum(sources,0))[numpy.maximum(targets,0),:]
+    state.update({"model":model,"matrix":matrix,"factor":factor,"green":green,"changed":numpy.zeros(0,dtype=numpy.int64)})
+    state["ddn"] = table(state,green)
+    return(state)
+
+def table(state,green):
+    """ddn from G[targets, sources], with zero rows and columns for unobserved cells and ring wells."""
+    ddn = state["scale"]*green
+    ddn[state["targets"] < 0,:] = 0.0
+    ddn[:,state["sources"] < 0] = 0.0
+    return(ddn)
+
+def updateinfluence(state,model,maxrank=None):
+    """Influence table after a change of conductivity (or any coefficient) of the aquifer; returns (ddn, info).
+
+    model is the changed aquifer, on the same grid with the same boundary
+    flags.  The change is taken against the factored base, and ddn comes
+    from the Woodbury correction (|S| back-substitutions) unless the
+    changed set S has more than maxrank cells (default: the number of
+    wells), in which case the base is rebuilt.  info holds the rank |S|,
+    the number of solves, whether the base was rebuilt, and the time."""
+    import scipy.linalg
+    start = time.perf_counter()
+    if maxrank is None:
+        maxrank = len(state["wells"])
+    matrix = unitmatrix(model)
+    if matrix.shape != state["matrix"].shape:
+        raise ValueError("the changed model has a different grid")
+    delta = (matrix - state["matrix"]).tocoo()
+    changed = numpy.unique(numpy.concatenate([delta.row[delta.data != 0.0],delta.col[delta.data != 0.0]]))
+    if changed.size > maxrank:
+        rebuild(state,model)
+        state["info"] = {"rank":int(changed.size),"solves":len(state["wells"]),"rebuilt":True,
+                         "seconds":time.perf_counter() - start}
+        return(state["ddn"],state["info"])
+    if changed.size == 0:
+        green = state["green"]
+    else:
+        z = unitsolves(state["factor"],matrix.shape[0],changed)
+        c = delta.tocsr()[changed][:,changed].toarray()
+        kernel = numpy.eye(changed.size) + c @ z[changed,:]
+        zsources = z[numpy.maximum(state["sources"],0),:]
+        ztargets = z[numpy.maximum(state["targets"],0),:]
+        green = state["green"] - ztargets @ scipy.linalg.solve(kernel,c @ zsources.T)
+    state.update({"model":model,"changed":changed,"ddn":table(state,green)})
+    state["info"] = {"rank":int(changed.size),"solves":int(changed.size),"rebuilt":False,
+                     "seconds":time.perf_counter() - start}
+    return(state["ddn"],state["info"])